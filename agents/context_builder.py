@@ -0,0 +1,125 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+try:
+    import tiktoken
+except ImportError:  # optional; token counts fall back to a character estimate
+    tiktoken = None
+
+load_dotenv()
+
+# Upper bound on prompt tokens (system prompt, template and packed context)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# tiktoken encoding used as a local approximation of the chat model's tokenizer
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+# A record is truncated to fit the remaining budget only if at least this many
+# tokens of it survive; otherwise it is dropped
+MIN_TRUNCATED_TOKENS = int(os.getenv("MIN_TRUNCATED_TOKENS", "24"))
+
+# Fallback estimate when no tokenizer is available
+CHARS_PER_TOKEN = 4
+ELLIPSIS = "…"
+
+class TokenCounter:
+    """
+    Counts and truncates text in tokens, with tiktoken when it is installed.
+    The encoding is loaded in a background thread on first use (it may have to
+    download its BPE file), and lengths are estimated from characters until
+    it is ready.
+    """
+    def __init__(self, encoding_name: str = TOKENIZER_ENCODING):
+        self.encoding_name = encoding_name
+        self.encoding = None
+        self._loading = False
+
+    def _load(self):
+        try:
+            self.encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            print(f"Tokenizer {self.encoding_name} unavailable, estimating tokens from length: {e}")
+
+    def _get_encoding(self):
+        if self.encoding is None and tiktoken is not None and not self._loading:
+            self._loading = True
+            threading.Thread(target=self._load, name="tokenizer-load", daemon=True).start()
+        return self.encoding
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The longest prefix of text that fits in max_tokens."""
+        if max_tokens <= 0:
+            return ""
+        encoding = self._get_encoding()
+        if encoding is not None:
+            tokens = encoding.encode(text)
+            return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+class ContextBuilder:
+    """
+    Packs retrieved records into a prompt's context section under a token
+    budget. Records are taken in the order given (most relevant first); the
+    first record that doesn't fit is truncated if enough of it survives, and
+    packing stops there.
+    """
+    def __init__(self, budget_tokens: int = CONTEXT_TOKEN_BUDGET, counter: Optional[TokenCounter] = None):
+        self.budget_tokens = budget_tokens
+        self.counter = counter or TokenCounter()
+
+    def build(
+        self,
+        records: List[Dict[str, Any]],
+        render: Callable[[int, Dict[str, Any], str], str],
+        fixed_texts: List[str],
+        max_records: Optional[int] = None,
+        separator: str = "\n"
+    ) -> Tuple[str, List[Dict[str, Any]], bool]:
+        """
+        Return (context, packed records, truncated). render(position, record,
+        text) formats one context line; fixed_texts are the other prompt parts
+        that share the budget.
+        """
+        remaining = self.budget_tokens - sum(self.counter.count(text) for text in fixed_texts)
+        separator_tokens = self.counter.count(separator)
+        items: List[str] = []
+        packed: List[Dict[str, Any]] = []
+        truncated = False
+
+        for record in records:
+            if max_records is not None and len(packed) >= max_records:
+                break
+            text = record.get('description', record.get('suggestion', '')) or ''
+            if not text:
+                continue
+            position = len(packed) + 1
+            item = render(position, record, text)
+            cost = self.counter.count(item) + (separator_tokens if items else 0)
+            if cost <= remaining:
+                items.append(item)
+                packed.append(record)
+                remaining -= cost
+                continue
+
+            # Fit as much of this record as the budget allows, then stop
+            overhead = self.counter.count(render(position, record, ELLIPSIS)) + (separator_tokens if items else 0)
+            allowed = remaining - overhead
+            if allowed >= MIN_TRUNCATED_TOKENS or not packed:
+                shortened = self.counter.truncate(text, allowed).rstrip()
+                if shortened:
+                    items.append(render(position, record, shortened + ELLIPSIS))
+                    packed.append(record)
+                    truncated = True
+            break
+
+        return separator.join(items), packed, truncated
+
+    def count_messages(self, messages: List[Any]) -> int:
+        """Estimated prompt tokens across chat messages (content only)."""
+        return sum(self.counter.count(str(getattr(message, "content", message))) for message in messages)
@@ -1,14 +1,168 @@
-from typing import List
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+import numpy as np
+from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
+from utils.cache import LRUCache
+
+load_dotenv()
 
 Model_name = "sentence-transformers/all-MiniLM-L6-v2"
 
+# Embedding executor settings: "thread" shares the loaded model across workers,
+# "process" loads one model per worker process and sidesteps the GIL entirely.
+EMBEDDING_EXECUTOR = os.getenv("EMBEDDING_EXECUTOR", "thread").lower()
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(os.cpu_count() or 1)))
+
+# Micro-batching settings: concurrent queries arriving within the wait window
+# are encoded together in a single forward pass.
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+# Query embedding cache settings (TTL in seconds, 0 disables expiry)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "0"))
+
+# Model instance owned by a process-pool worker (loaded once by the initializer)
+_worker_model: Optional[SentenceTransformer] = None
+
+def _init_worker(model_name: str):
+    """Load the embedding model once inside a process-pool worker."""
+    global _worker_model
+    _worker_model = SentenceTransformer(model_name)
+
+def _to_vectors(embeddings: np.ndarray) -> List[np.ndarray]:
+    """Split an encoded batch into per-text float32 vectors."""
+    return list(np.asarray(embeddings, dtype=np.float32))
+
+def _encode_batch_in_worker(texts: List[str]) -> List[np.ndarray]:
+    """Encode a batch of texts with the worker-local model."""
+    return _to_vectors(_worker_model.encode(texts, batch_size=len(texts)))
+
+def create_embedding_executor(kind: str = EMBEDDING_EXECUTOR, workers: int = EMBEDDING_WORKERS) -> Executor:
+    """Create the executor that embedding work is dispatched into."""
+    if kind == "process":
+        # Spawned, not forked: torch (and the reranker's OpenMP threads) are
+        # already running in this process, and forking them can deadlock
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(Model_name,)
+        )
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedder")
+    raise ValueError(f"Unknown EMBEDDING_EXECUTOR '{kind}', expected 'thread' or 'process'")
+
+def normalize_query(text: str) -> str:
+    """Normalize query text for cache keys (case and whitespace insensitive)."""
+    return " ".join(text.lower().split())
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into batched encode calls.
+    A batch is flushed when it reaches max_batch_size or when the oldest
+    pending text has waited max_wait_ms, whichever comes first.
+    """
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], Awaitable[List[np.ndarray]]],
+        max_batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS
+    ):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> np.ndarray:
+        """Queue a text for the next batch and wait for its vector."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Hand the pending texts to a background encode task."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Encode one batch and resolve each caller's future with its own vector."""
+        # Callers that gave up (e.g. cancelled requests) don't need encoding
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            vectors = await self.encode_batch([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
 class Embedder:
-    def __init__(self):
+    def __init__(self, executor_kind: str = EMBEDDING_EXECUTOR, workers: int = EMBEDDING_WORKERS):
         self.name = "embedder"
-        self.model = SentenceTransformer(Model_name)
-        
-    async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embeddings for the input text."""
-        embedding = self.model.encode(text)
-        return embedding.tolist()
\ No newline at end of file
+        self.executor_kind = executor_kind
+        # Process workers load their own copy of the model, so the parent doesn't need one
+        self.model = SentenceTransformer(Model_name) if executor_kind != "process" else None
+        self.executor = create_embedding_executor(executor_kind, workers)
+        self.batcher = EmbeddingBatcher(self.encode_batch)
+        self.cache = LRUCache(max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL)
+
+    def _encode_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Blocking batched encode call, executed on the embedding executor."""
+        return _to_vectors(self.model.encode(texts, batch_size=len(texts)))
+
+    async def encode_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Encode a list of texts in one forward pass without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        if self.executor_kind == "process":
+            return await loop.run_in_executor(self.executor, _encode_batch_in_worker, texts)
+        return await loop.run_in_executor(self.executor, self._encode_batch, texts)
+
+    async def generate_embedding(self, text: str) -> np.ndarray:
+        """
+        Generate a float32 embedding for the input text, batched with concurrent requests.
+        Repeat queries are served from the cache without touching the model.
+        """
+        normalized = normalize_query(text)
+        # Keyed by model name so switching Model_name never serves stale vectors
+        cache_key = (Model_name, normalized)
+        embedding = self.cache.get(cache_key)
+        if embedding is not None:
+            return embedding
+
+        embedding = await self.batcher.submit(normalized)
+        self.cache.set(cache_key, embedding)
+        return embedding
+
+    def close(self):
+        """Shut down the embedding executor."""
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            print("Embedder executor shut down")
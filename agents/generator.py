@@ -1,14 +1,38 @@
 import os
-from typing import List, Dict, Any
+import hashlib
+import json
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langchain_core.messages import SystemMessage, HumanMessage
+from agents.context_builder import ContextBuilder
+from agents.llm_scheduler import LLMScheduler, PRIORITY_QUERY, PRIORITY_SUGGESTIONS
+from utils.cache import LRUCache, SQLiteCache
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_MODEL_NAME = os.getenv("GROQ_MODEL_NAME")
 
+# Model cascade: when GROQ_FAST_MODEL_NAME is set, requests try that smaller
+# model (with a tighter completion limit) first and escalate to
+# GROQ_MODEL_NAME when a cheap check fails: suggestions that don't parse into
+# 3 items, an answer that is too short or was cut off by max_tokens
+# (finish_reason "length"), or retrieval confidence
+# below CASCADE_MIN_CONFIDENCE (which goes straight to the large model).
+GROQ_FAST_MODEL_NAME = os.getenv("GROQ_FAST_MODEL_NAME")
+FAST_MODEL_MAX_TOKENS = int(os.getenv("FAST_MODEL_MAX_TOKENS", "250"))
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.5"))
+CASCADE_MIN_ANSWER_CHARS = int(os.getenv("CASCADE_MIN_ANSWER_CHARS", "120"))
+
+# Exact response cache: identical prompts (same model, temperature and
+# retrieved record ids) reuse the stored completion. "memory" is a bounded
+# per-process LRU, "sqlite" persists to LLM_CACHE_PATH, "none" disables it.
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
 # Optimized prompts for your use case
 SUGGESTION_SYSTEM_PROMPT = """You are a financial insights assistant. Your job is to convert transaction analysis data into clear, actionable suggestions.
 
@@ -28,6 +52,61 @@ Rules:
 4. Give practical, actionable advice when appropriate
 5. Be conversational but professional"""
 
+SUGGESTION_USER_PROMPT = """Based on these transaction insights, generate exactly 3 practical financial suggestions:
+
+{context}
+
+Format your response as exactly 3 numbered suggestions, each on a new line:
+1. [First suggestion]
+2. [Second suggestion] 
+3. [Third suggestion]"""
+
+QUERY_USER_PROMPT = """User Question: {query}
+
+Relevant Transaction Insights:
+{context}
+
+Please provide a comprehensive answer based on this financial data. If the context doesn't fully address the question, mention what information might be missing."""
+
+NO_DATA_ANSWER = "I don't have enough transaction data to answer your question. Please ensure your database contains relevant financial insights."
+
+def _answer_error(error: Exception) -> str:
+    """User-facing answer text for a failed generation."""
+    return f"I encountered an error while analyzing your question: {str(error)}. Please try rephrasing your question or check if your database contains relevant transaction data."
+
+def parse_numbered_suggestions(content: str) -> List[str]:
+    """Extract the items of a "1. ... 2. ... 3. ..." list."""
+    suggestions = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if line and (line.startswith(('1.', '2.', '3.')) or line.startswith(('1)', '2)', '3)'))):
+            # Remove the number and period/parenthesis
+            suggestion_text = line[2:].strip() if line[1] in '.):' else line[3:].strip()
+            if suggestion_text:
+                suggestions.append(suggestion_text)
+    return suggestions
+
+def answer_escalation_reason(answer: str, response_metadata: Dict[str, Any]) -> Optional[str]:
+    """Why a fast-tier answer isn't good enough, or None if it is."""
+    if response_metadata.get("finish_reason") == "length":
+        # Stopped by the fast tier's tight max_tokens
+        return "answer_truncated"
+    if len(answer.strip()) < CASCADE_MIN_ANSWER_CHARS:
+        return "answer_too_short"
+    return None
+
+def suggestions_escalation_reason(content: str, response_metadata: Dict[str, Any]) -> Optional[str]:
+    """Why fast-tier suggestions aren't good enough, or None if they are."""
+    return None if len(parse_numbered_suggestions(content)) >= 3 else "parse_failure"
+
+def create_response_cache():
+    """Build the response cache selected by LLM_CACHE_BACKEND (None if disabled)."""
+    if LLM_CACHE_BACKEND == "sqlite":
+        return SQLiteCache(LLM_CACHE_PATH, max_size=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+    if LLM_CACHE_BACKEND == "memory":
+        return LRUCache(max_size=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+    return None
+
 class Generator:
     def __init__(self):
         self.name = "generator"
@@ -36,15 +115,114 @@ class Generator:
                 api_key=GROQ_API_KEY,
                 model=GROQ_MODEL_NAME,
                 temperature=0.7,
-                max_tokens=500
+                max_tokens=500,
+                # LLMScheduler is the only retry/backoff layer
+                max_retries=0
             )
             print("Generator initialized successfully")
         except Exception as e:
             print(f"Error initializing Generator: {e}")
             raise
-
-    async def generate_suggestions(self, records: List[Dict[str, Any]]) -> List[Dict]:
-        """Generate 3 actionable suggestions based on retrieved records."""
+        # Every chat model call goes through the scheduler (concurrency, rate limits, retries)
+        self.scheduler = LLMScheduler(self.llm)
+        # Optional fast tier; Groq rate-limits each model separately, so it has its own scheduler
+        self.fast_llm = None
+        self.fast_scheduler = None
+        if GROQ_FAST_MODEL_NAME:
+            self.fast_llm = ChatGroq(
+                api_key=GROQ_API_KEY,
+                model=GROQ_FAST_MODEL_NAME,
+                temperature=0.7,
+                max_tokens=FAST_MODEL_MAX_TOKENS,
+                max_retries=0
+            )
+            self.fast_scheduler = LLMScheduler(self.fast_llm)
+        self.cache = create_response_cache()
+        # Packs retrieved records into prompts under CONTEXT_TOKEN_BUDGET
+        self.context_builder = ContextBuilder()
+
+    def _tier(self, tier: str) -> Tuple[Any, LLMScheduler]:
+        """The chat model and scheduler for a tier ("fast" or "large")."""
+        if tier == "fast" and self.fast_llm is not None:
+            return self.fast_llm, self.fast_scheduler
+        return self.llm, self.scheduler
+
+    def _first_tier(self, records: List[Dict[str, Any]], metadata: Dict[str, Any]) -> str:
+        """Start on the fast tier unless it's disabled or retrieval confidence is low."""
+        if self.fast_llm is None:
+            return "large"
+        if max((record.get('confidence') or 0.0 for record in records), default=0.0) < CASCADE_MIN_CONFIDENCE:
+            metadata["escalation_reason"] = "low_retrieval_confidence"
+            return "large"
+        return "fast"
+
+    def _cache_key(self, messages: List, records: List[Dict[str, Any]], llm: Any = None) -> str:
+        """Hash of everything that determines the completion."""
+        llm = self.llm if llm is None else llm
+        system_prompt, user_prompt = messages[0].content, messages[1].content
+        key = json.dumps([
+            system_prompt,
+            user_prompt,
+            getattr(llm, "model_name", GROQ_MODEL_NAME),
+            getattr(llm, "temperature", None),
+            getattr(llm, "max_tokens", None),
+            [str(record.get('id')) for record in records]
+        ])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    async def _invoke(
+        self,
+        messages: List,
+        records: List[Dict[str, Any]],
+        use_cache: bool = True,
+        metadata: Optional[Dict[str, Any]] = None,
+        priority: int = PRIORITY_QUERY,
+        tier: str = "large"
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Run a tier's chat model, answering from the response cache when
+        possible. Returns (content, response_metadata); response_metadata is
+        empty for cache hits.
+        """
+        metadata = {} if metadata is None else metadata
+        llm, scheduler = self._tier(tier)
+        if self.cache is None or not use_cache:
+            metadata["llm_cache"] = "bypass"
+            response = await scheduler.ainvoke(messages, priority=priority)
+            self._record_usage(response, metadata)
+            return response.content.strip(), getattr(response, "response_metadata", None) or {}
+
+        key = self._cache_key(messages, records, llm)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            metadata["llm_cache"] = "hit"
+            return cached, {}
+        metadata["llm_cache"] = "miss"
+        response = await scheduler.ainvoke(messages, priority=priority)
+        self._record_usage(response, metadata)
+        content = response.content.strip()
+        response_metadata = getattr(response, "response_metadata", None) or {}
+        # Errors raise before this point, so only real completions are stored.
+        # A fast-tier completion cut off by max_tokens is escalated, so it
+        # isn't stored either (cache hits are therefore known to be complete).
+        if not (tier == "fast" and response_metadata.get("finish_reason") == "length"):
+            await self.cache.aset(key, content)
+        return content, response_metadata
+
+    async def generate_suggestions(
+        self,
+        records: List[Dict[str, Any]],
+        use_cache: bool = True,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """
+        Generate 3 actionable suggestions based on retrieved records.
+        use_cache=False skips the response cache; metadata, if given, receives
+        the cache outcome, the context packed (context_records), the prompt
+        tokens the provider reported (prompt_tokens, absent on cache hits) and
+        the model tier that served the request.
+        """
+        metadata = {} if metadata is None else metadata
         if not records:
             return [
                 {"suggestion": "Track your daily expenses to understand spending patterns", "confidence": 0.5},
@@ -53,43 +231,32 @@ class Generator:
             ]
         
         try:
-            # Prepare context from records
-            context_items = []
-            for i, record in enumerate(records[:3], 1):
-                desc = record.get('description', record.get('suggestion', ''))
-                confidence = record.get('confidence', 0.0)
-                context_items.append(f"{i}. {desc} (confidence: {confidence:.2f})")
-            
-            context = "\n".join(context_items)
-            
-            user_prompt = f"""Based on these transaction insights, generate exactly 3 practical financial suggestions:
-
-{context}
-
-Format your response as exactly 3 numbered suggestions, each on a new line:
-1. [First suggestion]
-2. [Second suggestion] 
-3. [Third suggestion]"""
-
+            # Prepare context from up to 3 records within the prompt token budget
+            context, packed = self._pack_context(
+                records,
+                lambda i, record, desc: f"{i}. {desc} (confidence: {record.get('confidence', 0.0):.2f})",
+                SUGGESTION_SYSTEM_PROMPT, SUGGESTION_USER_PROMPT.format(context=""),
+                metadata, max_records=3
+            )
             messages = [
                 SystemMessage(content=SUGGESTION_SYSTEM_PROMPT),
-                HumanMessage(content=user_prompt)
+                HumanMessage(content=SUGGESTION_USER_PROMPT.format(context=context))
             ]
             
-            response = await self.llm.ainvoke(messages)
-            content = response.content.strip()
-            
-            # Parse the numbered suggestions
-            suggestions = []
-            lines = content.split('\n')
-            
-            for line in lines:
-                line = line.strip()
-                if line and (line.startswith(('1.', '2.', '3.')) or line.startswith(('1)', '2)', '3)'))):
-                    # Remove the number and period/parenthesis
-                    suggestion_text = line[2:].strip() if line[1] in '.):' else line[3:].strip()
-                    if suggestion_text:
-                        suggestions.append(suggestion_text)
+            # Parse the numbered suggestions; the fast tier escalates if they don't parse
+            tier = self._first_tier(packed, metadata)
+            content = None
+            if tier == "fast":
+                content = await self._try_fast_tier(
+                    messages, packed, use_cache, metadata, PRIORITY_SUGGESTIONS, suggestions_escalation_reason
+                )
+            if content is None:
+                tier = "large"
+                content, _ = await self._invoke(
+                    messages, packed, use_cache, metadata, priority=PRIORITY_SUGGESTIONS, tier=tier
+                )
+            metadata["model_tier"] = tier
+            suggestions = parse_numbered_suggestions(content)
             
             # Ensure we have exactly 3 suggestions
             while len(suggestions) < 3:
@@ -107,51 +274,188 @@ Format your response as exactly 3 numbered suggestions, each on a new line:
             return result
             
         except Exception as e:
+            # Retries are exhausted by now; fall back to the retrieved insights
+            # themselves rather than presenting the error as a suggestion
             print(f"Error generating suggestions: {e}")
+            metadata["generation_error"] = str(e)
             return [
-                {"suggestion": f"Error generating suggestions: {str(e)}", "confidence": 0.0},
-                {"suggestion": "Please try your request again", "confidence": 0.0},
-                {"suggestion": "Contact support if the issue persists", "confidence": 0.0}
+                {
+                    "suggestion": record.get('description', record.get('suggestion', '')),
+                    "confidence": record.get('confidence', 0.0)
+                }
+                for record in records[:3]
             ]
 
-    async def generate_answer(self, records: List[Dict[str, Any]], query: str) -> str:
-        """Generate a comprehensive answer based on retrieved context."""
+    async def _try_fast_tier(
+        self,
+        messages: List,
+        records: List[Dict[str, Any]],
+        use_cache: bool,
+        metadata: Dict[str, Any],
+        priority: int,
+        check
+    ) -> Optional[str]:
+        """
+        Run the fast tier and return its output, or None (recording why) when
+        check(output, response_metadata) names a reason to escalate or the
+        call fails.
+        """
+        try:
+            content, response_metadata = await self._invoke(
+                messages, records, use_cache, metadata, priority=priority, tier="fast"
+            )
+        except Exception as e:
+            print(f"Fast model failed, escalating: {e}")
+            metadata["escalation_reason"] = "fast_model_error"
+            return None
+        reason = check(content, response_metadata)
+        if reason:
+            print(f"Escalating to {GROQ_MODEL_NAME}: {reason}")
+            metadata["escalation_reason"] = reason
+            return None
+        return content
+
+    def _pack_context(
+        self,
+        records: List[Dict[str, Any]],
+        render,
+        system_prompt: str,
+        empty_user_prompt: str,
+        metadata: Optional[Dict[str, Any]],
+        max_records: Optional[int] = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Pack records (most relevant first) into the context under the token budget."""
+        context, packed, truncated = self.context_builder.build(
+            records, render, [system_prompt, empty_user_prompt], max_records=max_records
+        )
+        if metadata is not None:
+            metadata["context_records"] = len(packed)
+            metadata["context_truncated"] = truncated
+        return context, packed
+
+    def _record_usage(self, message: Any, metadata: Dict[str, Any]):
+        """
+        Add the input tokens the provider reported for a call (or stream chunk)
+        to metadata["prompt_tokens"]; escalated requests count both calls.
+        The ContextBuilder's local count is only an estimate for packing.
+        """
+        usage = getattr(message, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens") if isinstance(usage, dict) else None
+        if input_tokens is not None:
+            metadata["prompt_tokens"] = metadata.get("prompt_tokens", 0) + input_tokens
+
+    def _answer_messages(
+        self,
+        records: List[Dict[str, Any]],
+        query: str,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List, List[Dict[str, Any]]]:
+        """Build the chat messages for answering query, and the records packed into them."""
+        context, packed = self._pack_context(
+            records,
+            lambda i, record, desc: f"• {desc} (relevance: {record.get('confidence', 0.0):.2f})",
+            QUERY_SYSTEM_PROMPT, QUERY_USER_PROMPT.format(query=query, context=""),
+            metadata
+        )
+        messages = [
+            SystemMessage(content=QUERY_SYSTEM_PROMPT),
+            HumanMessage(content=QUERY_USER_PROMPT.format(query=query, context=context))
+        ]
+        return messages, packed
+
+    async def generate_answer(
+        self,
+        records: List[Dict[str, Any]],
+        query: str,
+        use_cache: bool = True,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Generate a comprehensive answer based on retrieved context.
+        use_cache=False skips the response cache; metadata, if given, receives
+        the cache outcome, the context packed (context_records), the prompt
+        tokens the provider reported (prompt_tokens, absent on cache hits) and
+        the model tier that served the request.
+        """
         if not records:
-            return "I don't have enough transaction data to answer your question. Please ensure your database contains relevant financial insights."
+            return NO_DATA_ANSWER
         
+        metadata = {} if metadata is None else metadata
         try:
-            # Prepare context from records
-            context_items = []
-            for record in records:
-                desc = record.get('description', '')
-                confidence = record.get('confidence', 0.0)
-                if desc:
-                    context_items.append(f"• {desc} (relevance: {confidence:.2f})")
-            
-            context = "\n".join(context_items)
-            
-            user_prompt = f"""User Question: {query}
-
-Relevant Transaction Insights:
-{context}
-
-Please provide a comprehensive answer based on this financial data. If the context doesn't fully address the question, mention what information might be missing."""
-
-            messages = [
-                SystemMessage(content=QUERY_SYSTEM_PROMPT),
-                HumanMessage(content=user_prompt)
-            ]
-            
-            response = await self.llm.ainvoke(messages)
-            return response.content.strip()
+            messages, packed = self._answer_messages(records, query, metadata)
+            if self._first_tier(packed, metadata) == "fast":
+                answer = await self._try_fast_tier(
+                    messages, packed, use_cache, metadata, PRIORITY_QUERY, answer_escalation_reason
+                )
+                if answer is not None:
+                    metadata["model_tier"] = "fast"
+                    return answer
+            metadata["model_tier"] = "large"
+            answer, _ = await self._invoke(messages, packed, use_cache, metadata)
+            return answer
             
         except Exception as e:
             print(f"Error generating answer: {e}")
-            return f"I encountered an error while analyzing your question: {str(e)}. Please try rephrasing your question or check if your database contains relevant transaction data."
-
-
-
-
+            metadata["generation_error"] = str(e)
+            return _answer_error(e)
+
+    async def stream_answer(
+        self,
+        records: List[Dict[str, Any]],
+        query: str,
+        use_cache: bool = True,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Same as generate_answer, but yields the answer text chunk by chunk as the
+        model produces it. Errors are yielded as text, just as generate_answer
+        returns them. A cached answer is yielded as a single chunk, and a
+        completed stream is stored in the cache. Streams always use the large
+        model, since an answer can't be escalated once it has been sent.
+        """
+        metadata = {} if metadata is None else metadata
+        metadata["model_tier"] = "large"
+        if not records:
+            yield NO_DATA_ANSWER
+            return
+        
+        messages, packed = self._answer_messages(records, query, metadata)
+        key = None
+        if self.cache is not None and use_cache:
+            key = self._cache_key(messages, packed)
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                metadata["llm_cache"] = "hit"
+                yield cached
+                return
+            metadata["llm_cache"] = "miss"
+        else:
+            metadata["llm_cache"] = "bypass"
+        
+        started = False
+        chunks: List[str] = []
+        try:
+            async for chunk in self.scheduler.astream(messages, priority=PRIORITY_QUERY):
+                self._record_usage(chunk, metadata)
+                text = chunk.content
+                if not started:
+                    # Match generate_answer, which strips leading whitespace
+                    text = text.lstrip()
+                    started = bool(text)
+                if text:
+                    chunks.append(text)
+                    yield text
+            if key is not None:
+                await self.cache.aset(key, "".join(chunks).strip())
+        except Exception as e:
+            print(f"Error streaming answer: {e}")
+            metadata["generation_error"] = str(e)
+            yield ("\n\n" if started else "") + _answer_error(e)
+
+    def close(self):
+        """Release the response cache (closes the SQLite file if used)."""
+        if isinstance(self.cache, SQLiteCache):
+            self.cache.close()
 
 # import os
 # from typing import List, Dict, Any
@@ -0,0 +1,265 @@
+import os
+import time
+import heapq
+import asyncio
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Admission control for chat model calls; 0 disables a rate limit
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "6000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+# Lower values are admitted first when calls queue up
+PRIORITY_SUGGESTIONS = int(os.getenv("LLM_PRIORITY_SUGGESTIONS", "0"))
+PRIORITY_QUERY = int(os.getenv("LLM_PRIORITY_QUERY", "1"))
+
+# Rough characters-per-token ratio for estimating prompt size before a call
+CHARS_PER_TOKEN = 4
+
+class TokenBucket:
+    """
+    Continuously refilling budget of `per_minute` units. Consumption may drive
+    the level negative (when actual usage exceeds the estimate), which simply
+    delays later callers.
+    """
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    async def acquire(self, amount: float):
+        """Wait until `amount` units are available, then consume them."""
+        if self.per_minute <= 0:
+            return
+        # A single call larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            wait = self._blocked_until - time.monotonic()
+            if wait <= 0:
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) * 60 / self.per_minute
+            await asyncio.sleep(wait)
+
+    def adjust(self, amount: float):
+        """Charge (positive) or refund (negative) units after the fact."""
+        if self.per_minute > 0:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+    def block(self, seconds: float):
+        """Hold every caller for `seconds`, e.g. after the provider returns 429."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on the provider's error response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and connection problems are worth retrying."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+def _total_tokens(message: Any) -> Optional[int]:
+    """total_tokens from a response's (or chunk's) usage_metadata, if reported."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens") if isinstance(usage, dict) else None
+
+def estimate_tokens(messages: List[Any], max_tokens: Optional[int] = None) -> int:
+    """Prompt tokens estimated from message length, plus the completion limit."""
+    chars = sum(len(str(getattr(message, "content", message))) for message in messages)
+    return chars // CHARS_PER_TOKEN + (max_tokens or 0)
+
+class LLMScheduler:
+    """
+    Wraps a chat model so bursts queue instead of tripping provider rate limits.
+    Calls wait for one of `max_concurrency` slots (granted in priority order),
+    then for room in the requests- and tokens-per-minute buckets. Retryable
+    failures are retried with jittered exponential backoff, honoring
+    Retry-After; a 429 pauses every queued call, not just the one that got it.
+    The wrapped model should not retry on its own (e.g. ChatGroq max_retries=0).
+    """
+    def __init__(
+        self,
+        llm: Any,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES
+    ):
+        self.llm = llm
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._in_flight = 0
+        self._waiters: List[tuple] = []
+        self._sequence = 0
+        self.stats_counters = {
+            "calls": 0, "admissions": 0, "retries": 0, "rate_limited": 0, "failures": 0,
+            "total_wait": 0.0, "max_wait": 0.0
+        }
+
+    async def _acquire_slot(self, priority: int):
+        """Wait for a concurrency slot; waiters are served lowest priority value first."""
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._waiters, (priority, self._sequence, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        """Hand the slot to the next live waiter, or free it."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    async def _admit(self, messages: List[Any], priority: int) -> int:
+        """Take a slot and rate budget for one attempt; returns the tokens charged."""
+        start = time.monotonic()
+        await self._acquire_slot(priority)
+        try:
+            estimate = estimate_tokens(messages, getattr(self.llm, "max_tokens", None))
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimate)
+        except BaseException:
+            self._release_slot()
+            raise
+        wait = time.monotonic() - start
+        self.stats_counters["admissions"] += 1
+        self.stats_counters["total_wait"] += wait
+        self.stats_counters["max_wait"] = max(self.stats_counters["max_wait"], wait)
+        return estimate
+
+    def _settle(self, estimate: int, total: Optional[int]):
+        """Correct the token bucket with the usage the provider reported."""
+        if total is not None:
+            self.tokens.adjust(total - estimate)
+
+    def _backoff(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the error isn't retryable."""
+        if attempt >= self.max_retries or not _is_retryable(error):
+            return None
+        delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if _status_code(error) == 429:
+            self.stats_counters["rate_limited"] += 1
+            retry_after = _retry_after(error)
+            if retry_after is not None:
+                delay = retry_after + random.uniform(0, LLM_BACKOFF_BASE)
+            self.requests.block(delay)
+        return delay
+
+    async def ainvoke(self, messages: List[Any], priority: int = PRIORITY_QUERY) -> Any:
+        """Scheduled, retried equivalent of llm.ainvoke(messages)."""
+        self.stats_counters["calls"] += 1
+        attempt = 0
+        while True:
+            estimate = await self._admit(messages, priority)
+            try:
+                response = await self.llm.ainvoke(messages)
+                self._settle(estimate, _total_tokens(response))
+                return response
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    self.stats_counters["failures"] += 1
+                    raise
+                error_name = type(e).__name__
+            finally:
+                self._release_slot()
+            attempt += 1
+            self.stats_counters["retries"] += 1
+            print(f"LLM call failed ({error_name}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def astream(self, messages: List[Any], priority: int = PRIORITY_QUERY) -> AsyncIterator[Any]:
+        """
+        Scheduled equivalent of llm.astream(messages). Failures are retried only
+        before the first chunk; after that they propagate to the caller. Usage
+        reported on the chunks (usually the last one) settles the token bucket
+        once the stream ends.
+        """
+        self.stats_counters["calls"] += 1
+        attempt = 0
+        while True:
+            estimate = await self._admit(messages, priority)
+            started = False
+            total: Optional[int] = None
+            try:
+                async for chunk in self.llm.astream(messages):
+                    started = True
+                    chunk_total = _total_tokens(chunk)
+                    if chunk_total is not None:
+                        total = (total or 0) + chunk_total
+                    yield chunk
+                self._settle(estimate, total)
+                return
+            except Exception as e:
+                delay = None if started else self._backoff(e, attempt)
+                if delay is None:
+                    self.stats_counters["failures"] += 1
+                    raise
+                error_name = type(e).__name__
+            finally:
+                self._release_slot()
+            attempt += 1
+            self.stats_counters["retries"] += 1
+            print(f"LLM stream failed ({error_name}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait times and retry counters for metrics endpoints."""
+        counters = dict(self.stats_counters)
+        calls, admissions = counters["calls"], counters["admissions"]
+        return {
+            "queue_depth": sum(1 for _, _, future in self._waiters if not future.done()),
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "calls": calls,
+            "retries": counters["retries"],
+            "rate_limited": counters["rate_limited"],
+            "failures": counters["failures"],
+            "avg_wait_ms": round(counters["total_wait"] / admissions * 1000, 3) if admissions else 0.0,
+            "max_wait_ms": round(counters["max_wait"] * 1000, 3)
+        }
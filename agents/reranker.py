@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from sentence_transformers import CrossEncoder
+
+load_dotenv()
+
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+# Candidate pool retrieved for re-ranking, and the per-request time budget
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "1"))
+
+class Reranker:
+    """
+    Re-scores retrieved records against the query with a small CPU
+    cross-encoder. Scoring runs in batches off the event loop and stops at the
+    time budget, in which case the vector order is kept.
+    """
+    def __init__(self, model_name: str = RERANKER_MODEL, workers: int = RERANK_WORKERS):
+        self.name = "reranker"
+        self.model_name = model_name
+        self.model: Optional[CrossEncoder] = None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reranker")
+        self._loading: Optional[asyncio.Future] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def initialize(self):
+        """Load the cross-encoder off the event loop."""
+        if self.model is not None:
+            return
+        if self._loading is None:
+            loop = asyncio.get_running_loop()
+            self._loading = loop.run_in_executor(self.executor, CrossEncoder, self.model_name)
+        try:
+            self.model = await self._loading
+            print(f"Reranker loaded {self.model_name}")
+        finally:
+            self._loading = None
+
+    def _warmup_done(self, task: asyncio.Task):
+        """Drop a finished background load and report its failure, if any."""
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error loading reranker model {self.model_name}: {task.exception()}")
+
+    def _score(self, query: str, texts: List[str], deadline: float) -> Optional[List[float]]:
+        """Score (query, text) pairs batch by batch; None if the deadline passes first."""
+        scores: List[float] = []
+        for start in range(0, len(texts), RERANK_BATCH_SIZE):
+            if time.monotonic() >= deadline:
+                return None
+            pairs = [(query, text) for text in texts[start:start + RERANK_BATCH_SIZE]]
+            scores.extend(float(score) for score in self.model.predict(pairs, batch_size=len(pairs)))
+        return scores
+
+    async def rerank(
+        self,
+        query: str,
+        records: List[Dict[str, Any]],
+        top_k: int = 3,
+        budget_ms: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Return the top_k records by cross-encoder score and whether re-ranking ran.
+        Falls back to the incoming (vector) order if the model isn't loaded yet
+        or the budget runs out; a budget_ms of 0 or less skips re-ranking.
+        """
+        budget = (RERANK_BUDGET_MS if budget_ms is None else budget_ms) / 1000
+        if len(records) <= 1 or budget <= 0:
+            return records[:top_k], False
+        if self.model is None:
+            # Warm the model for later requests without spending this one's budget
+            if self._loading is None:
+                task = asyncio.ensure_future(self.initialize())
+                self._tasks.add(task)
+                task.add_done_callback(self._warmup_done)
+            return records[:top_k], False
+
+        deadline = time.monotonic() + budget
+        texts = [record.get('description', '') for record in records]
+        loop = asyncio.get_running_loop()
+        try:
+            scores = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self._score, query, texts, deadline),
+                timeout=budget
+            )
+        except asyncio.TimeoutError:
+            scores = None
+        except Exception as e:
+            print(f"Error re-ranking records: {e}")
+            scores = None
+
+        if scores is None:
+            print(f"Re-ranking skipped: budget of {budget * 1000:.0f}ms exhausted")
+            return records[:top_k], False
+
+        order = sorted(range(len(records)), key=lambda i: scores[i], reverse=True)[:top_k]
+        reranked = []
+        for rank, i in enumerate(order, 1):
+            record = dict(records[i])
+            record['rerank_score'] = scores[i]
+            record['rank'] = rank
+            reranked.append(record)
+        return reranked, True
+
+    def close(self):
+        """Cancel a background model load and shut down the scoring executor."""
+        for task in self._tasks:
+            task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
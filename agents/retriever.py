@@ -1,80 +1,728 @@
-from typing import List, Dict, Any
+import asyncio
+from datetime import datetime, timezone
+from decimal import Decimal
+import hashlib
+import time
+from typing import Collection, List, Dict, Any, Optional, Tuple
 import asyncpg
-from db.connection import get_db_pool
+import numpy as np
+from db.connection import INSIGHTS_CHANNEL, DatabaseRouter, connect_listener, parse_insights_payload
+from db.indexes import QUANTIZED_COLUMNS, get_partial_index_categories
+from agents.vector_index import InMemoryVectorIndex
+from utils.cache import LRUCache
+from utils.latency import LatencyTracker
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# "sql" searches pgvector directly, "memory" answers from an in-process NumPy mirror
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "sql").lower()
+
+# Default retrieval mode: "vector" (cosine only) or "hybrid" (full-text + vector
+# fused with reciprocal-rank fusion); overridable per call
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "5"))
+
+# pgvector >= 0.8 can keep walking the HNSW graph until enough rows pass a
+# filter ("relaxed_order" or "strict_order"); unset leaves the server default
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN")
+
+# Retrieval result cache; entries are dropped whenever ingestion NOTIFYs a
+# change, and the TTL bounds staleness if the LISTEN connection is lost
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+
+# Maximal-marginal-relevance diversification: fetch MMR_FETCH_MULTIPLIER x top_k
+# candidates with their embeddings, then greedily pick a relevant but
+# non-redundant top_k (lambda 1.0 = pure relevance, 0.0 = pure diversity)
+RETRIEVAL_MMR = os.getenv("RETRIEVAL_MMR", "false").lower() == "true"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+MMR_FETCH_MULTIPLIER = int(os.getenv("MMR_FETCH_MULTIPLIER", "4"))
+
+# Per-call deadline for SQL retrieval (0 disables it); overridable per call.
+# A query that runs past it is cancelled and the call returns no records.
+RETRIEVAL_TIMEOUT_MS = float(os.getenv("RETRIEVAL_TIMEOUT_MS", "2000"))
+
+# Hedged reads: if a query hasn't answered within the HEDGE_PERCENTILE latency
+# of recent queries, the same query is sent on a second connection (on the
+# least-busy replica when several are configured); the first answer wins and
+# the other query is cancelled. Until HEDGE_MIN_SAMPLES latencies have been
+# observed, HEDGE_INITIAL_DELAY_MS is used instead.
+RETRIEVAL_HEDGE = os.getenv("RETRIEVAL_HEDGE", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "5"))
+HEDGE_INITIAL_DELAY_MS = float(os.getenv("HEDGE_INITIAL_DELAY_MS", "50"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "500"))
+
+# Structured filters on transaction_insights columns. Queries use {filters}
+# as the slot for the generated AND-clauses.
+# Queries only return row embeddings when MMR needs them: {embedding} (and in
+# HYBRID_SEARCH_QUERY {text_embedding} / {fused_embedding}) are filled by
+# _embedding_columns and left empty otherwise.
+FILTER_FIELDS = ("category", "insight_type", "min_amount", "max_amount", "created_after", "created_before")
+
+VECTOR_SEARCH_QUERY = """
+    SELECT 
+        id, 
+        description{embedding},
+        1 - (embedding <=> $1::vector) as similarity_score
+    FROM transaction_insights 
+    WHERE embedding IS NOT NULL{filters}
+    ORDER BY embedding <=> $1::vector
+    LIMIT $2
+"""
+
+# Optional coarse search on a compact column ("halfvec" or "binary", see
+# db/indexes.py) followed by an exact re-rank of an oversampled candidate set
+RETRIEVAL_QUANTIZATION = os.getenv("RETRIEVAL_QUANTIZATION", "").lower() or None
+QUANTIZED_OVERSAMPLE = int(os.getenv("QUANTIZED_OVERSAMPLE", "4"))
+
+# $1 query vector, $2 result limit, $3 coarse candidate count
+QUANTIZED_SEARCH_QUERY = """
+    SELECT
+        id,
+        description{embedding},
+        1 - (embedding <=> $1::vector) as similarity_score
+    FROM (
+        SELECT id, description, embedding
+        FROM transaction_insights
+        WHERE {column} IS NOT NULL{filters}
+        ORDER BY {column} {operator} {query_value}
+        LIMIT $3
+    ) candidates
+    ORDER BY embedding <=> $1::vector
+    LIMIT $2
+"""
+
+# Both candidate lists are ranked and fused in a single round trip. The lexical
+# side ORs the query terms so merchant/category words match on their own.
+# $1 query vector, $2 query text, $3 result limit, $4 candidates per list,
+# $5 vector weight, $6 text weight, $7 RRF k constant
+HYBRID_SEARCH_QUERY = """
+    WITH vector_hits AS (
+        SELECT id, description{embedding}, similarity_score,
+               ROW_NUMBER() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT id, description{embedding},
+                   embedding <=> $1::vector AS distance,
+                   1 - (embedding <=> $1::vector) AS similarity_score
+            FROM transaction_insights
+            WHERE embedding IS NOT NULL{filters}
+            ORDER BY embedding <=> $1::vector
+            LIMIT $4
+        ) v
+    ),
+    text_hits AS (
+        SELECT id, description{embedding}, similarity_score,
+               ROW_NUMBER() OVER (ORDER BY text_score DESC) AS rank
+        FROM (
+            SELECT t.id, t.description{text_embedding},
+                   ts_rank_cd(t.description_tsv, tq.q) AS text_score,
+                   1 - (t.embedding <=> $1::vector) AS similarity_score
+            FROM transaction_insights t
+            CROSS JOIN (
+                SELECT replace(plainto_tsquery('english', $2)::text, ' & ', ' | ')::tsquery AS q
+            ) tq
+            WHERE t.description_tsv @@ tq.q AND t.embedding IS NOT NULL{text_filters}
+            ORDER BY text_score DESC
+            LIMIT $4
+        ) l
+    )
+    SELECT
+        COALESCE(v.id, l.id) AS id,
+        COALESCE(v.description, l.description) AS description,{fused_embedding}
+        COALESCE(v.similarity_score, l.similarity_score) AS similarity_score,
+        COALESCE($5::float8 / ($7 + v.rank), 0) + COALESCE($6::float8 / ($7 + l.rank), 0) AS rrf_score
+    FROM vector_hits v
+    FULL OUTER JOIN text_hits l ON v.id = l.id
+    ORDER BY rrf_score DESC
+    LIMIT $3
+"""
+
+def _embedding_columns(with_embeddings: bool) -> Dict[str, str]:
+    """Fill the embedding column slots of the search queries."""
+    if not with_embeddings:
+        return {"embedding": "", "text_embedding": "", "fused_embedding": ""}
+    return {
+        "embedding": ", embedding",
+        "text_embedding": ", t.embedding",
+        "fused_embedding": "\n        COALESCE(v.embedding, l.embedding) AS embedding,"
+    }
+
+def _sql_literal(value: str) -> str:
+    """Quote a string as an SQL literal (standard_conforming_strings is on by default)."""
+    value = str(value)
+    if "\x00" in value:
+        raise ValueError("Filter values cannot contain NUL characters")
+    return "'" + value.replace("'", "''") + "'"
+
+def _naive_utc(value: datetime) -> datetime:
+    """created_at is TIMESTAMP without time zone, so compare in naive UTC."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def build_filter_clause(
+    filters: Optional[Dict[str, Any]],
+    start_index: int,
+    alias: str = "",
+    inline_categories: Collection[str] = ()
+) -> Tuple[str, List[Any]]:
+    """
+    Turn structured filters into AND-clauses numbered from $start_index.
+    A single category listed in inline_categories (the ones with a partial
+    vector index, see db/indexes.py) is inlined as a literal so the planner
+    can match that index; every other value stays a bind parameter, which
+    keeps the prepared-statement cache bounded.
+    """
+    if not filters:
+        return "", []
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown retrieval filters: {', '.join(sorted(unknown))}")
+
+    prefix = f"{alias}." if alias else ""
+    clauses: List[str] = []
+    params: List[Any] = []
+
+    def add(template: str, value: Any):
+        params.append(value)
+        clauses.append(template.format(param=f"${start_index + len(params) - 1}"))
+
+    for column in ("category", "insight_type"):
+        value = filters.get(column)
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else list(value)
+        if len(values) == 1 and column == "category" and values[0] in inline_categories:
+            clauses.append(f"{prefix}category = {_sql_literal(values[0])}")
+        elif values:
+            add(f"{prefix}{column} = ANY({{param}}::text[])", values)
+
+    if filters.get("min_amount") is not None:
+        add(f"{prefix}amount >= {{param}}::numeric", Decimal(str(filters["min_amount"])))
+    if filters.get("max_amount") is not None:
+        add(f"{prefix}amount <= {{param}}::numeric", Decimal(str(filters["max_amount"])))
+    if filters.get("created_after") is not None:
+        add(f"{prefix}created_at >= {{param}}::timestamp", _naive_utc(filters["created_after"]))
+    if filters.get("created_before") is not None:
+        add(f"{prefix}created_at < {{param}}::timestamp", _naive_utc(filters["created_before"]))
+
+    sql = "".join(f" AND {clause}" for clause in clauses)
+    return sql, params
+
+def maximal_marginal_relevance(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    top_k: int,
+    lambda_mult: float = MMR_LAMBDA,
+    relevance: Optional[np.ndarray] = None
+) -> List[int]:
+    """
+    Pick top_k candidate indices balancing relevance to the query against
+    similarity to already-picked candidates, with vectorized cosine math.
+    relevance, if given, replaces the cosine to the query as the relevance
+    term (e.g. fused hybrid scores rescaled to [0, 1]).
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.shape[0] == 0 or top_k <= 0:
+        return []
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    if relevance is None:
+        relevance = candidates @ query
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything selected so far
+    redundancy = pairwise[selected[0]].copy()
+    while len(selected) < min(top_k, candidates.shape[0]):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return selected
+
+def embedding_fingerprint(embedding: np.ndarray) -> str:
+    """Stable short hash of a float32 embedding, used in cache keys."""
+    data = np.ascontiguousarray(embedding, dtype=np.float32).tobytes()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    """Seconds to rounded milliseconds for metrics."""
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+def _freeze(value: Any) -> Any:
+    """Make filter values hashable for cache keys."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
 class Retriever:
-    def __init__(self):
+    def __init__(self, backend: str = RETRIEVER_BACKEND):
         self.name = "retriever"
-        self.pool = None
+        # Reads go to the least-busy healthy replica, falling back to the primary
+        self.db: Optional[DatabaseRouter] = None
+        self.backend = backend
+        self.index: Optional[InMemoryVectorIndex] = None
+        self.cache = LRUCache(max_size=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+        # Bumped on every change notification; results computed under an older
+        # version are never stored
+        self.data_version = 0
+        self._listener: Optional[asyncpg.Connection] = None
+        # Recent SQL latencies, used to pick the hedging delay
+        self.latency = LatencyTracker(window=HEDGE_WINDOW)
+        self.query_stats = {"queries": 0, "timeouts": 0, "hedged": 0, "hedge_wins": 0}
+        # Categories with a partial vector index; only these are inlined in SQL
+        self.partial_categories: frozenset = frozenset()
 
     async def initialize(self):
-        """Initialize the database pool."""
+        """Initialize the database pools (and the in-memory index when enabled)."""
         try:
-            self.pool = await get_db_pool()
+            db = DatabaseRouter()
+            await db.initialize()
+            await db.warm()
+            self.db = db
+            await self._load_partial_categories()
+            if self.backend == "memory":
+                # The mirror follows NOTIFYs, which only the primary delivers promptly
+                self.index = InMemoryVectorIndex()
+                await self.index.start(self.db.primary)
+            await self._start_invalidation_listener()
             print("Retriever initialized successfully")
         except Exception as e:
             print(f"Error initializing retriever: {e}")
             raise
 
-    async def get_similar_records(self, query_embedding: List[float], top_k: int = 3) -> List[Dict[str, Any]]:
+    async def get_similar_records(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 3,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: Optional[str] = None,
+        query_text: Optional[str] = None,
+        vector_weight: float = 1.0,
+        text_weight: float = 1.0,
+        filters: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        quantization: Optional[str] = None,
+        mmr: Optional[bool] = None,
+        mmr_lambda: Optional[float] = None,
+        fetch_k: Optional[int] = None,
+        timeout_ms: Optional[float] = None,
+        hedge: Optional[bool] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Retrieve top-k similar records using direct vector similarity search.
+        ef_search (HNSW) and probes (IVFFlat) trade recall for latency per call;
+        they are applied transaction-locally so they only affect this query.
+        mode="hybrid" also runs a full-text search on query_text and fuses both
+        rankings with weighted reciprocal-rank fusion.
+        filters restrict candidates by category, insight_type, amount range
+        and created_at range inside the SQL query itself.
+        SQL results are cached per (embedding, top_k, options) until the table changes.
+        quantization ("halfvec" or "binary") runs the coarse vector search on a
+        compact column and re-ranks QUANTIZED_OVERSAMPLE x top_k candidates exactly.
+        mmr diversifies the final top_k out of fetch_k candidates (see
+        maximal_marginal_relevance), trading some relevance for less redundancy.
+        In hybrid mode its relevance term is the fusion score, so lexical-only
+        hits keep the rank fusion gave them.
+        timeout_ms bounds the SQL round trip (RETRIEVAL_TIMEOUT_MS by default);
+        hedge sends a duplicate query when the first one is slow (see RETRIEVAL_HEDGE).
+        A timed-out search returns [] like an empty one; metadata, if given,
+        gets timed_out=True to tell them apart.
         """
-        if not self.pool:
+        if not self.db:
             await self.initialize()
         
+        mode = (mode or RETRIEVAL_MODE).lower()
+        if mode == "hybrid" and not query_text:
+            mode = "vector"
+        quantization = (quantization or RETRIEVAL_QUANTIZATION or "").lower() or None
+        if quantization == "none":
+            quantization = None
+        mmr = RETRIEVAL_MMR if mmr is None else mmr
+        mmr_lambda = MMR_LAMBDA if mmr_lambda is None else float(mmr_lambda)
+        # Number of candidates to fetch before the optional MMR stage
+        limit = max(top_k, fetch_k or top_k * MMR_FETCH_MULTIPLIER) if mmr else top_k
+        
+        if self.index is not None and mode == "vector" and not filters:
+            # ANN knobs don't apply to the exact in-memory search
+            results = self.index.search(query_embedding, limit, with_embeddings=mmr)
+            results = self._diversify(query_embedding, results, top_k, mmr_lambda) if mmr else self._format_results(results)
+            print(f"Successfully retrieved {len(results)} similar records from memory")
+            return results
+        
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        cache_key = (
+            embedding_fingerprint(query_vector), top_k, mode,
+            query_text if mode == "hybrid" else None,
+            float(vector_weight), float(text_weight), ef_search, probes, _freeze(filters),
+            quantization if mode == "vector" else None,
+            (limit, mmr_lambda) if mmr else None
+        )
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return [dict(record) for record in cached]
+        version = self.data_version
+        
         try:
-            # Convert embedding to PostgreSQL vector format
-            embedding_str = f"[{','.join(map(str, query_embedding))}]"
+            # Sent as a binary vector by the pgvector codec registered on the pool
+            if mode == "hybrid":
+                params = [
+                    query_vector, query_text, limit, max(limit * HYBRID_CANDIDATE_MULTIPLIER, limit),
+                    float(vector_weight), float(text_weight), RRF_K
+                ]
+                filter_sql, filter_params = build_filter_clause(
+                    filters, len(params) + 1, inline_categories=self.partial_categories
+                )
+                # The lexical side reuses the same parameters under its table alias
+                text_filter_sql, _ = build_filter_clause(
+                    filters, len(params) + 1, alias="t", inline_categories=self.partial_categories
+                )
+                query = HYBRID_SEARCH_QUERY.format(
+                    filters=filter_sql, text_filters=text_filter_sql, **_embedding_columns(mmr)
+                )
+            elif quantization:
+                if quantization not in QUANTIZED_COLUMNS:
+                    raise ValueError(f"Unknown quantization '{quantization}'")
+                spec = QUANTIZED_COLUMNS[quantization]
+                params = [query_vector, limit, limit * max(1, QUANTIZED_OVERSAMPLE)]
+                filter_sql, filter_params = build_filter_clause(
+                    filters, len(params) + 1, inline_categories=self.partial_categories
+                )
+                query = QUANTIZED_SEARCH_QUERY.format(
+                    column=spec['column'],
+                    operator=spec['operator'],
+                    query_value=spec['expression'].format(source="$1::vector"),
+                    filters=filter_sql,
+                    embedding=_embedding_columns(mmr)["embedding"]
+                )
+            else:
+                params = [query_vector, limit]
+                filter_sql, filter_params = build_filter_clause(
+                    filters, len(params) + 1, inline_categories=self.partial_categories
+                )
+                query = VECTOR_SEARCH_QUERY.format(
+                    filters=filter_sql, embedding=_embedding_columns(mmr)["embedding"]
+                )
+            params.extend(filter_params)
             
-            # Use connection from pool
-            async with self.pool.acquire() as conn:
-                # Direct SQL query for vector similarity search
-                query = """
-                    SELECT 
-                        id, 
-                        description,
-                        1 - (embedding <=> $1::vector) as similarity_score
-                    FROM transaction_insights 
-                    WHERE embedding IS NOT NULL
-                    ORDER BY embedding <=> $1::vector
-                    LIMIT $2
-                """
-                
-                results = await conn.fetch(query, embedding_str, top_k)
-                
-                if not results:
-                    print("No similar records found in database")
-                    return []
-                
-                # Format results
-                formatted_results = []
-                for i, record in enumerate(results):
-                    formatted_results.append({
-                        'id': record['id'],
-                        'description': record['description'],
-                        'suggestion': record['description'],  # Use description as suggestion base
-                        'confidence': float(record['similarity_score']) if record['similarity_score'] else 0.0,
-                        'rank': i + 1
-                    })
-                
-                print(f"Successfully retrieved {len(formatted_results)} similar records")
-                return formatted_results
-                
+            # Use a read connection (replica when configured)
+            results = await self._fetch(
+                query, params, ef_search, probes, bool(filters), timeout_ms=timeout_ms, hedge=hedge
+            )
+            
+            if mmr:
+                formatted_results = self._diversify(query_vector, results, top_k, mmr_lambda)
+            else:
+                formatted_results = self._format_results(results)
+            if use_cache and version == self.data_version:
+                self.cache.set(cache_key, [dict(record) for record in formatted_results])
+            
+            if not formatted_results:
+                print("No similar records found in database")
+                return []
+            
+            print(f"Successfully retrieved {len(formatted_results)} similar records ({quantization or mode})")
+            return formatted_results
+            
+        except asyncio.TimeoutError:
+            print(f"Retrieval timed out after {self._timeout(timeout_ms) * 1000:.0f}ms")
+            if metadata is not None:
+                metadata["timed_out"] = True
+            return []
         except Exception as e:
             print(f"Error retrieving similar records: {e}")
-            print(f"Query embedding length: {len(query_embedding) if query_embedding else 'None'}")
+            print(f"Query embedding length: {len(query_embedding) if query_embedding is not None else 'None'}")
+            return []
+
+    async def get_similar_records_many(
+        self,
+        query_embeddings: List[np.ndarray],
+        top_k: int = 3,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        timeout_ms: Optional[float] = None,
+        hedge: Optional[bool] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve top-k similar records for several queries in one round trip.
+        Returns one result list per input embedding, in input order.
+        """
+        if len(query_embeddings) == 0:
             return []
+        if not self.db:
+            await self.initialize()
+        
+        query_matrix = np.asarray(query_embeddings, dtype=np.float32)
+        
+        if self.index is not None and not filters:
+            grouped = self.index.search_many(query_matrix, top_k)
+            return [self._format_results(rows) for rows in grouped]
+        
+        try:
+            count, dim = query_matrix.shape
+            # The queries travel as one flat binary real[] and are sliced back into
+            # vectors server-side; each gets its own LATERAL top-k index scan
+            query = """
+                WITH queries AS (
+                    SELECT
+                        ord,
+                        (($1::real[])[(ord - 1) * $2 + 1 : ord * $2])::vector AS query_vector
+                    FROM generate_series(1, $3) AS ord
+                )
+                SELECT q.ord, r.id, r.description, r.similarity_score
+                FROM queries q
+                CROSS JOIN LATERAL (
+                    SELECT
+                        t.id,
+                        t.description,
+                        1 - (t.embedding <=> q.query_vector) as similarity_score
+                    FROM transaction_insights t
+                    WHERE t.embedding IS NOT NULL{filters}
+                    ORDER BY t.embedding <=> q.query_vector
+                    LIMIT $4
+                ) r
+                ORDER BY q.ord, r.similarity_score DESC
+            """
+            params = [query_matrix.ravel().tolist(), dim, count, top_k]
+            filter_sql, filter_params = build_filter_clause(
+                filters, len(params) + 1, alias="t", inline_categories=self.partial_categories
+            )
+            query = query.format(filters=filter_sql)
+            results = await self._fetch(
+                query, params + filter_params, ef_search, probes, bool(filters),
+                timeout_ms=timeout_ms, hedge=hedge
+            )
+            
+            grouped: List[List[Any]] = [[] for _ in range(count)]
+            for record in results:
+                grouped[record['ord'] - 1].append(record)
+            
+            print(f"Successfully retrieved similar records for {count} queries")
+            return [self._format_results(rows) for rows in grouped]
+            
+        except asyncio.TimeoutError:
+            print(f"Batch retrieval timed out after {self._timeout(timeout_ms) * 1000:.0f}ms")
+            return [[] for _ in range(len(query_embeddings))]
+        except Exception as e:
+            print(f"Error retrieving similar records for {len(query_embeddings)} queries: {e}")
+            return [[] for _ in range(len(query_embeddings))]
+
+    async def _execute(
+        self,
+        query: str,
+        params: List[Any],
+        ef_search: Optional[int],
+        probes: Optional[int],
+        filtered: bool
+    ) -> List[asyncpg.Record]:
+        """Run one search on a read connection."""
+        settings = self._search_settings(ef_search, probes, filtered=filtered)
+
+        async def search(conn: asyncpg.Connection) -> List[asyncpg.Record]:
+            if not settings:
+                return await conn.fetch(query, *params)
+            async with conn.transaction():
+                await self._apply_search_settings(conn, settings)
+                return await conn.fetch(query, *params)
+
+        return await self.db.read(search)
+
+    def _timeout(self, timeout_ms: Optional[float]) -> Optional[float]:
+        """Deadline in seconds for one retrieval, or None for no limit."""
+        timeout_ms = RETRIEVAL_TIMEOUT_MS if timeout_ms is None else timeout_ms
+        return timeout_ms / 1000 if timeout_ms and timeout_ms > 0 else None
+
+    def _hedge_delay(self) -> float:
+        """Seconds to wait for the first query before sending the hedge."""
+        if len(self.latency) < HEDGE_MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY_MS / 1000
+        return max(self.latency.percentile(HEDGE_PERCENTILE), HEDGE_MIN_DELAY_MS / 1000)
+
+    async def _fetch(
+        self,
+        query: str,
+        params: List[Any],
+        ef_search: Optional[int],
+        probes: Optional[int],
+        filtered: bool,
+        timeout_ms: Optional[float] = None,
+        hedge: Optional[bool] = None
+    ) -> List[asyncpg.Record]:
+        """
+        Run a search under the retrieval deadline, hedged when enabled. Its
+        latency is recorded from the first send, including searches that time
+        out or are cancelled (at the time they gave up), so slow queries that
+        lose a hedge still count toward the tail the hedge delay is based on.
+        """
+        self.query_stats["queries"] += 1
+        hedge = RETRIEVAL_HEDGE if hedge is None else hedge
+        args = (query, params, ef_search, probes, filtered)
+        search = self._hedged_execute(*args) if hedge else self._execute(*args)
+        start = time.perf_counter()
+        try:
+            results = await asyncio.wait_for(search, timeout=self._timeout(timeout_ms))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self.latency.record(time.perf_counter() - start)
+            if isinstance(e, asyncio.TimeoutError):
+                self.query_stats["timeouts"] += 1
+            raise
+        self.latency.record(time.perf_counter() - start)
+        return results
+
+    async def _hedged_execute(self, *args) -> List[asyncpg.Record]:
+        """
+        Start the query, and if it is still running after the hedge delay start
+        a duplicate on another connection. Returns the first successful result
+        and cancels whichever query is still running.
+        """
+        tasks = [asyncio.ensure_future(self._execute(*args))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay())
+            if not done:
+                self.query_stats["hedged"] += 1
+                tasks.append(asyncio.ensure_future(self._execute(*args)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.query_stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _start_invalidation_listener(self):
+        """LISTEN for ingestion writes so cached results never outlive the data."""
+        try:
+            self._listener = await connect_listener()
+            await self._listener.add_listener(INSIGHTS_CHANNEL, self._on_data_changed)
+        except Exception as e:
+            print(f"Retrieval cache LISTEN unavailable, relying on TTL expiry: {e}")
+            self._listener = None
+
+    def _on_data_changed(self, connection, pid, channel, payload):
+        """Invalidate every cached result after transaction_insights changes."""
+        self.data_version += 1
+        self.cache.clear()
+        if self.db:
+            # Replicas that haven't replayed the write would refill the cache with stale rows
+            lsn, _ = parse_insights_payload(payload)
+            self.db.require_lsn(lsn)
+
+    def invalidate_cache(self):
+        """Drop cached results, e.g. after writes made in this process."""
+        self._on_data_changed(None, None, INSIGHTS_CHANNEL, "")
+
+    def _diversify(self, query_embedding: np.ndarray, results, top_k: int, mmr_lambda: float) -> List[Dict[str, Any]]:
+        """
+        Apply MMR to candidate rows (which carry embeddings) and format the
+        picks. Hybrid rows are scored on their fusion score scaled to [0, 1]
+        rather than on cosine alone.
+        """
+        results = list(results)
+        if len(results) <= 1:
+            return self._format_results(results)
+        candidates = np.stack([np.asarray(record['embedding'], dtype=np.float32) for record in results])
+        relevance = None
+        if 'rrf_score' in results[0].keys():
+            fused = np.array([float(record['rrf_score'] or 0.0) for record in results], dtype=np.float32)
+            relevance = fused / max(float(fused.max()), 1e-12)
+        selected = maximal_marginal_relevance(query_embedding, candidates, top_k, mmr_lambda, relevance=relevance)
+        return self._format_results([results[i] for i in selected])
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Pool and cache metrics for the app's metrics endpoint."""
+        return {
+            "pools": self.db.status() if self.db else {},
+            "cache": self.cache.stats(),
+            "queries": {
+                **self.query_stats,
+                "p50_ms": _ms(self.latency.percentile(50)),
+                "p99_ms": _ms(self.latency.percentile(99)),
+                "hedge_delay_ms": _ms(self._hedge_delay())
+            },
+            "data_version": self.data_version,
+            "in_memory_records": len(self.index) if self.index is not None else None
+        }
+
+    def _format_results(self, results) -> List[Dict[str, Any]]:
+        """Shape database or in-memory rows into the retriever's result dicts."""
+        formatted_results = []
+        for i, record in enumerate(results):
+            formatted_results.append({
+                'id': record['id'],
+                'description': record['description'],
+                'suggestion': record['description'],  # Use description as suggestion base
+                'confidence': float(record['similarity_score']) if record['similarity_score'] else 0.0,
+                'rank': i + 1
+            })
+            if 'rrf_score' in record.keys():
+                formatted_results[-1]['fusion_score'] = float(record['rrf_score'])
+        return formatted_results
+
+    def _search_settings(
+        self,
+        ef_search: Optional[int],
+        probes: Optional[int],
+        filtered: bool = False
+    ) -> List[Tuple[str, str]]:
+        """The per-query ANN knobs that apply to this search, as (setting, value) pairs."""
+        settings = []
+        if ef_search is not None:
+            settings.append(("hnsw.ef_search", str(int(ef_search))))
+        if probes is not None:
+            settings.append(("ivfflat.probes", str(int(probes))))
+        if filtered and HNSW_ITERATIVE_SCAN:
+            # Keep scanning the graph instead of returning fewer than top_k filtered rows
+            settings.append(("hnsw.iterative_scan", HNSW_ITERATIVE_SCAN))
+        return settings
+
+    async def _load_partial_categories(self):
+        """Read which categories have a partial vector index (built offline by db/indexes.py)."""
+        try:
+            async with self.db.primary.acquire() as conn:
+                self.partial_categories = frozenset(await get_partial_index_categories(conn))
+        except Exception as e:
+            print(f"Could not list partial vector indexes, binding all category filters: {e}")
+            self.partial_categories = frozenset()
+
+    async def _apply_search_settings(self, conn: asyncpg.Connection, settings: List[Tuple[str, str]]):
+        """Apply ANN knobs in one round trip; must run inside the query's transaction."""
+        calls = ", ".join(f"set_config(${2 * i + 1}, ${2 * i + 2}, true)" for i in range(len(settings)))
+        await conn.execute(f"SELECT {calls}", *(item for setting in settings for item in setting))
 
     async def close(self):
         """Close the database pool."""
-        if self.pool:
-            await self.pool.close()
-            self.pool = None
+        if self.index:
+            await self.index.stop()
+            self.index = None
+        if self._listener:
+            await self._listener.close()
+            self._listener = None
+        if self.db:
+            await self.db.close()
+            self.db = None
             print("Retriever connections closed")
 
 
@@ -1,6 +1,10 @@
 # ===== FIXED SUPERVISOR.PY =====
+import os
+import asyncio
+import copy
+import json
 from typing_extensions import TypedDict
-from typing import Any, Annotated, List, Dict
+from typing import Any, Annotated, AsyncIterator, List, Dict, Optional, Tuple
 from langchain_core.tools import tool, InjectedToolCallId
 from langgraph.prebuilt import InjectedState
 from langgraph.graph import StateGraph, START, END, MessagesState
@@ -9,8 +13,62 @@ from langchain_core.runnables import RunnableConfig
 from langchain.chat_models import init_chat_model
 from agents.retriever import Retriever
 from agents.generator import Generator
-from agents.embedder import Embedder
+from agents.embedder import Embedder, normalize_query
+from agents.reranker import Reranker, RERANK_BUDGET_MS, RERANK_CANDIDATES, RERANK_ENABLED
+from agents.retriever import RETRIEVAL_TIMEOUT_MS
+from agents.vector_index import EMBEDDING_DIM
 from utils.formatter import format_suggestions
+from utils.semantic_cache import SemanticCache
+from utils.singleflight import SingleFlight
+from utils.deadline import Deadline, DeadlineExceeded
+
+def _optional_int(name: str) -> Optional[int]:
+    """Read an optional integer setting from the environment."""
+    value = os.getenv(name)
+    return int(value) if value else None
+
+# Per-endpoint ANN recall/latency knobs (unset = use the server defaults)
+SUGGESTIONS_SEARCH_SETTINGS = {
+    "ef_search": _optional_int("SUGGESTIONS_EF_SEARCH"),
+    "probes": _optional_int("SUGGESTIONS_PROBES")
+}
+QUERY_SEARCH_SETTINGS = {
+    "ef_search": _optional_int("QUERY_EF_SEARCH"),
+    "probes": _optional_int("QUERY_PROBES")
+}
+
+# Semantic answer cache for /query and /query/stream: a new question reuses a
+# stored answer when its embedding is at least SEMANTIC_CACHE_THRESHOLD
+# cosine-similar to a past question asked with the same options. Cleared
+# whenever the data changes.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+# /suggestions: "retrieval" returns the top insights straight from retrieval
+# (tens of milliseconds), "llm" rewrites them with the Generator; requests can
+# override this with polish. With SUGGESTIONS_BACKGROUND_POLISH, retrieval-mode
+# requests also start the LLM rewrite in the background so a follow-up
+# polish=true request is answered from the response cache.
+SUGGESTIONS_MODE = os.getenv("SUGGESTIONS_MODE", "retrieval").lower()
+SUGGESTIONS_BACKGROUND_POLISH = os.getenv("SUGGESTIONS_BACKGROUND_POLISH", "false").lower() == "true"
+
+# Concurrent identical requests (same normalized query and options) share one
+# embed -> retrieve -> generate pipeline instead of each running their own
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() == "true"
+
+# End-to-end time budget per endpoint (embed -> retrieve -> generate); requests
+# can override it with deadline_ms, and 0 disables it. A stage still running
+# at the deadline is cancelled and the response degrades, e.g. to the
+# retrieved insights without LLM synthesis.
+SUGGESTIONS_DEADLINE_MS = float(os.getenv("SUGGESTIONS_DEADLINE_MS", "5000"))
+QUERY_DEADLINE_MS = float(os.getenv("QUERY_DEADLINE_MS", "15000"))
+
+NO_CONTEXT_ANSWER = "I don't have enough information to answer your question."
+TIMEOUT_ANSWER = "I ran out of time before finding relevant insights. Please try again."
+TIMEOUT_SUGGESTION = "Suggestions are taking longer than expected. Please try again."
+DEGRADED_ANSWER_INTRO = "I ran out of time to write a full answer. These are the most relevant insights I found:"
 
 class State(TypedDict):
     query: str
@@ -23,17 +81,31 @@ class State(TypedDict):
 retriever_agent = Retriever()
 generator_agent = Generator()
 embedder_agent = Embedder()
+reranker_agent = Reranker()
 
 class Supervisor:
     def __init__(self):
         self.retriever = retriever_agent
         self.generator = generator_agent
         self.embedder = embedder_agent
+        self.reranker = reranker_agent
+        self.semantic_cache = SemanticCache(
+            EMBEDDING_DIM,
+            max_size=SEMANTIC_CACHE_SIZE,
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            ttl=SEMANTIC_CACHE_TTL
+        )
+        # Retriever data version the semantic cache was filled under
+        self._semantic_cache_version = 0
+        self.singleflight = SingleFlight()
+        self._background_tasks: set = set()
 
     async def initialize(self):
         """Initialize all components"""
         try:
             await self.retriever.initialize()
+            if RERANK_ENABLED:
+                await self.reranker.initialize()
             print("Supervisor initialized successfully")
         except Exception as e:
             print(f"Error initializing supervisor: {e}")
@@ -42,83 +114,498 @@ class Supervisor:
     async def cleanup(self):
         """Cleanup resources"""
         try:
+            for task in self._background_tasks:
+                task.cancel()
             await self.retriever.close()
+            self.embedder.close()
+            self.reranker.close()
+            self.generator.close()
             print("Supervisor cleanup completed")
         except Exception as e:
             print(f"Error during cleanup: {e}")
 
-    async def get_top_suggestions(self, query: str) -> List[Dict]:
+    def get_metrics(self) -> Dict[str, Any]:
+        """Collect runtime metrics from every component."""
+        return {
+            "embedder": {"cache": self.embedder.cache.stats()},
+            "retriever": self.retriever.get_metrics(),
+            "generator": {
+                "cache": self.generator.cache.stats() if self.generator.cache is not None else None,
+                "scheduler": self.generator.scheduler.stats(),
+                "fast_scheduler": self.generator.fast_scheduler.stats() if self.generator.fast_scheduler else None
+            },
+            "semantic_cache": self.semantic_cache.stats(),
+            "coalescing": self.singleflight.stats()
+        }
+
+    async def get_top_suggestions(
+        self,
+        query: str,
+        retrieval_options: Optional[Dict[str, Any]] = None,
+        llm_cache: Optional[bool] = None,
+        polish: Optional[bool] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        deadline_ms: Optional[float] = None
+    ) -> List[Dict]:
         """
         Get top 3 suggestions based on user query.
         This is for the /suggestions endpoint.
+        retrieval_options are per-request Retriever settings (e.g. mode, weights).
+        polish=True rewrites the insights with the LLM, polish=False returns
+        them as retrieved with their similarity scores; unset follows
+        SUGGESTIONS_MODE.
+        llm_cache=False bypasses the Generator's response cache.
+        Concurrent identical requests share one pipeline run.
+        metadata, if given, receives how the suggestions were produced
+        (polished, model_tier, coalesced, degraded, timed_out_stage).
+        deadline_ms bounds the whole pipeline (SUGGESTIONS_DEADLINE_MS by
+        default); if polishing runs out of time the insights are returned as
+        retrieved.
         """
+        polish = SUGGESTIONS_MODE == "llm" if polish is None else polish
+        deadline_ms = SUGGESTIONS_DEADLINE_MS if deadline_ms is None else deadline_ms
+        if not REQUEST_COALESCING:
+            suggestions, run_metadata = await self._get_top_suggestions(
+                query, retrieval_options, llm_cache, polish, deadline_ms
+            )
+            shared = False
+        else:
+            key = self._coalescing_key(
+                "suggestions", query, retrieval_options=retrieval_options, llm_cache=llm_cache,
+                polish=polish, deadline_ms=deadline_ms
+            )
+            (suggestions, run_metadata), shared = await self.singleflight.do(
+                key, lambda: self._get_top_suggestions(query, retrieval_options, llm_cache, polish, deadline_ms)
+            )
+        if metadata is not None:
+            metadata.update(run_metadata, coalesced=shared)
+        return copy.deepcopy(suggestions) if shared else suggestions
+
+    async def _get_top_suggestions(
+        self,
+        query: str,
+        retrieval_options: Optional[Dict[str, Any]],
+        llm_cache: Optional[bool],
+        polish: bool,
+        deadline_ms: Optional[float]
+    ) -> Tuple[List[Dict], Dict[str, Any]]:
+        """The /suggestions pipeline behind get_top_suggestions; returns (suggestions, metadata)."""
+        metadata: Dict[str, Any] = {"polished": False, "model_tier": None, "degraded": False}
+        deadline = Deadline(deadline_ms)
+        similar_records: List[Dict[str, Any]] = []
         try:
             # Step 1: Generate embedding for the query
-            embedding = await self.embedder.generate_embedding(query)
+            embedding = await deadline.run("embed", self.embedder.generate_embedding(query))
             print(f"Generated embedding for query: {query}")
             
             # Step 2: Retrieve similar records from database
-            similar_records = await self.retriever.get_similar_records(embedding, top_k=3)
+            similar_records = await self._retrieve(
+                deadline, embedding, top_k=3, query_text=query,
+                **{**SUGGESTIONS_SEARCH_SETTINGS, **(retrieval_options or {})}
+            )
             print(f"Retrieved {len(similar_records)} similar records")
             
             if not similar_records:
-                return [{"suggestion": "No relevant suggestions found.", "confidence": 0.0}]
+                return [{"suggestion": "No relevant suggestions found.", "confidence": 0.0}], metadata
+            
+            if not polish:
+                # Fast path: the insights themselves, ranked by similarity
+                if SUGGESTIONS_BACKGROUND_POLISH and llm_cache is not False:
+                    self._polish_in_background(similar_records)
+                return self._insight_suggestions(similar_records), metadata
             
             # Step 3: Generate natural language suggestions using LLM
-            suggestions = await self.generator.generate_suggestions(similar_records)
+            suggestions = await deadline.run("generate", self.generator.generate_suggestions(
+                similar_records, use_cache=llm_cache is not False, metadata=metadata
+            ))
+            # A generation error falls back to the raw insights, which aren't polished
+            metadata["polished"] = "generation_error" not in metadata
             print(f"Generated {len(suggestions)} suggestions")
             
             # Step 4: Format and return suggestions
-            return suggestions[:3]  # Ensure we return exactly 3 suggestions
+            return suggestions[:3], metadata  # Ensure we return exactly 3 suggestions
             
+        except DeadlineExceeded as e:
+            print(f"Suggestions degraded after {deadline.elapsed_ms():.0f}ms: {e}")
+            metadata.update(degraded=True, timed_out_stage=e.stage, polished=False, model_tier=None)
+            if not similar_records:
+                return [{"suggestion": TIMEOUT_SUGGESTION, "confidence": 0.0}], metadata
+            return self._insight_suggestions(similar_records), metadata
         except Exception as e:
             print(f"Error getting top suggestions: {e}")
-            return [{"suggestion": f"Error: {str(e)}", "confidence": 0.0}]
-
-    async def answer_query(self, query: str) -> Dict:
+            return [{"suggestion": f"Error: {str(e)}", "confidence": 0.0}], metadata
+
+    def _insight_suggestions(self, records: List[Dict[str, Any]]) -> List[Dict]:
+        """The top 3 retrieved insights as suggestions, ranked by similarity."""
+        return [
+            {
+                "id": record.get("id"),
+                "suggestion": record.get("suggestion", record.get("description", "")),
+                "confidence": record.get("confidence", 0.0)
+            }
+            for record in records[:3]
+        ]
+
+    def _polish_in_background(self, records: List[Dict[str, Any]]):
+        """Warm the Generator's response cache for a later polish=True request."""
+        task = asyncio.ensure_future(self.generator.generate_suggestions(records))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def answer_query(
+        self,
+        query: str,
+        retrieval_options: Optional[Dict[str, Any]] = None,
+        rerank: Optional[bool] = None,
+        rerank_budget_ms: Optional[float] = None,
+        llm_cache: Optional[bool] = None,
+        semantic_cache: Optional[bool] = None,
+        deadline_ms: Optional[float] = None
+    ) -> Dict:
         """
         Answer a query by retrieving context and generating a single comprehensive answer.
         This is for the /query endpoint.
+        retrieval_options are per-request Retriever settings (e.g. mode, weights).
+        rerank retrieves a wider candidate pool and re-orders it with the
+        cross-encoder within rerank_budget_ms (0 skips it) before generation.
+        llm_cache=False bypasses the Generator's response cache and
+        semantic_cache=False the semantic answer cache; on a semantic hit the
+        metadata names the stored question that matched.
+        Concurrent identical requests share one pipeline run; metadata.coalesced
+        is True for the callers that joined one already in flight.
+        deadline_ms bounds the whole pipeline (QUERY_DEADLINE_MS by default);
+        when a stage runs out of time the answer degrades to the retrieved
+        insights and metadata.timed_out_stage names the stage.
         """
+        options = {
+            "retrieval_options": retrieval_options,
+            "rerank": rerank,
+            "rerank_budget_ms": rerank_budget_ms,
+            "llm_cache": llm_cache,
+            "semantic_cache": semantic_cache,
+            "deadline_ms": QUERY_DEADLINE_MS if deadline_ms is None else deadline_ms
+        }
+        if not REQUEST_COALESCING:
+            return await self._answer_query(query, **options)
+        result, shared = await self.singleflight.do(
+            self._coalescing_key("query", query, **options),
+            lambda: self._answer_query(query, **options)
+        )
+        if shared:
+            result = copy.deepcopy(result)
+        result["metadata"]["coalesced"] = shared
+        return result
+
+    async def _answer_query(
+        self,
+        query: str,
+        retrieval_options: Optional[Dict[str, Any]],
+        rerank: Optional[bool],
+        rerank_budget_ms: Optional[float],
+        llm_cache: Optional[bool],
+        semantic_cache: Optional[bool],
+        deadline_ms: Optional[float]
+    ) -> Dict:
+        """The /query pipeline behind answer_query."""
+        metadata: Dict[str, Any] = {"reranked": False, "degraded": False}
+        use_semantic_cache = SEMANTIC_CACHE_ENABLED and semantic_cache is not False
+        deadline = Deadline(deadline_ms)
+        similar_records: List[Dict[str, Any]] = []
         try:
             # Step 1: Generate embedding for the query
-            embedding = await self.embedder.generate_embedding(query)
+            embedding = await deadline.run("embed", self.embedder.generate_embedding(query))
             print(f"Generated embedding for query: {query}")
             
-            # Step 2: Retrieve similar records from database
-            similar_records = await self.retriever.get_similar_records(embedding, top_k=3)
-            print(f"Retrieved {len(similar_records)} similar records for answer generation")
+            namespace = self._semantic_namespace(retrieval_options, rerank)
+            if use_semantic_cache:
+                cached = self._semantic_lookup(embedding, namespace, metadata)
+                if cached is not None:
+                    return cached
+            else:
+                metadata["semantic_cache"] = "bypass"
+            
+            # Step 2: retrieve and optionally re-rank
+            similar_records = await self._retrieve_context(
+                query, embedding, retrieval_options, rerank, rerank_budget_ms, metadata, deadline
+            )
             
             if not similar_records:
                 return {
-                    "answer": "I don't have enough information to answer your question.",
-                    "sources": []
+                    "answer": NO_CONTEXT_ANSWER,
+                    "sources": [],
+                    "metadata": metadata
                 }
             
             # Step 3: Generate comprehensive answer using LLM
-            answer = await self.generator.generate_answer(similar_records, query)
+            answer = await deadline.run("generate", self.generator.generate_answer(
+                similar_records, query, use_cache=llm_cache is not False, metadata=metadata
+            ))
             
             # Step 4: Prepare sources
-            sources = [
-                {
-                    "id": record.get("id", "unknown"),
-                    "title": record.get("description", "")[:100] + "..." if len(record.get("description", "")) > 100 else record.get("description", ""),
-                    "confidence": record.get("confidence", 0.0)
-                }
-                for record in similar_records
-            ]
-            
-            return {
+            result = {
                 "answer": answer,
-                "sources": sources
+                "sources": self._sources(similar_records),
+                "metadata": metadata
             }
+            if use_semantic_cache and "generation_error" not in metadata:
+                self._semantic_store(embedding, query, namespace, result)
+            return result
             
+        except DeadlineExceeded as e:
+            print(f"Answer degraded after {deadline.elapsed_ms():.0f}ms: {e}")
+            metadata.update(degraded=True, timed_out_stage=e.stage)
+            return {
+                "answer": self._degraded_answer(similar_records),
+                "sources": self._sources(similar_records),
+                "metadata": metadata
+            }
         except Exception as e:
             print(f"Error answering query: {e}")
             return {
                 "answer": f"I encountered an error while processing your question: {str(e)}",
-                "sources": []
+                "sources": [],
+                "metadata": metadata
+            }
+
+    async def stream_answer_query(
+        self,
+        query: str,
+        retrieval_options: Optional[Dict[str, Any]] = None,
+        rerank: Optional[bool] = None,
+        rerank_budget_ms: Optional[float] = None,
+        llm_cache: Optional[bool] = None,
+        semantic_cache: Optional[bool] = None,
+        deadline_ms: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of answer_query for the /query/stream endpoint.
+        Yields {"event", "data"} dicts: one "sources" event as soon as retrieval
+        is done, then a "token" event per answer chunk, then "done".
+        A semantic cache hit is sent as a single "token" event, and a completed
+        stream is stored in the semantic cache just like an answer_query result.
+        The deadline works as in answer_query; a stream cut short by it keeps
+        the text already sent and reports timed_out_stage in "done".
+        Concurrent identical requests share one upstream stream: callers that
+        join late first receive the events sent so far, and "done" carries
+        metadata.coalesced.
+        """
+        options = {
+            "retrieval_options": retrieval_options,
+            "rerank": rerank,
+            "rerank_budget_ms": rerank_budget_ms,
+            "llm_cache": llm_cache,
+            "semantic_cache": semantic_cache,
+            "deadline_ms": QUERY_DEADLINE_MS if deadline_ms is None else deadline_ms
+        }
+        if not REQUEST_COALESCING:
+            async for event in self._stream_answer_query(query, **options):
+                yield event
+            return
+        events = self.singleflight.stream(
+            self._coalescing_key("query_stream", query, **options),
+            lambda: self._stream_answer_query(query, **options)
+        )
+        async for event, shared in events:
+            if shared:
+                event = copy.deepcopy(event)
+            if event["event"] == "done":
+                event["data"]["metadata"]["coalesced"] = shared
+            yield event
+
+    async def _stream_answer_query(
+        self,
+        query: str,
+        retrieval_options: Optional[Dict[str, Any]],
+        rerank: Optional[bool],
+        rerank_budget_ms: Optional[float],
+        llm_cache: Optional[bool],
+        semantic_cache: Optional[bool],
+        deadline_ms: Optional[float]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """The /query/stream pipeline behind stream_answer_query."""
+        metadata: Dict[str, Any] = {"reranked": False, "degraded": False}
+        use_semantic_cache = SEMANTIC_CACHE_ENABLED and semantic_cache is not False
+        deadline = Deadline(deadline_ms)
+        similar_records: List[Dict[str, Any]] = []
+        try:
+            embedding = await deadline.run("embed", self.embedder.generate_embedding(query))
+            namespace = self._semantic_namespace(retrieval_options, rerank)
+            cached = None
+            if use_semantic_cache:
+                cached = self._semantic_lookup(embedding, namespace, metadata)
+            else:
+                metadata["semantic_cache"] = "bypass"
+            if cached is None:
+                similar_records = await self._retrieve_context(
+                    query, embedding, retrieval_options, rerank, rerank_budget_ms, metadata, deadline
+                )
+        except DeadlineExceeded as e:
+            print(f"Answer degraded after {deadline.elapsed_ms():.0f}ms: {e}")
+            metadata.update(degraded=True, timed_out_stage=e.stage)
+            yield {"event": "sources", "data": {"sources": self._sources(similar_records), "metadata": metadata}}
+            yield {"event": "token", "data": {"text": self._degraded_answer(similar_records)}}
+            yield {"event": "done", "data": {"metadata": metadata}}
+            return
+        except Exception as e:
+            print(f"Error answering query: {e}")
+            yield {"event": "sources", "data": {"sources": [], "metadata": metadata}}
+            yield {"event": "token", "data": {"text": f"I encountered an error while processing your question: {str(e)}"}}
+            yield {"event": "done", "data": {"metadata": metadata}}
+            return
+        
+        if cached is not None:
+            yield {"event": "sources", "data": {"sources": cached["sources"], "metadata": cached["metadata"]}}
+            yield {"event": "token", "data": {"text": cached["answer"]}}
+            yield {"event": "done", "data": {"metadata": cached["metadata"]}}
+            return
+        
+        yield {"event": "sources", "data": {"sources": self._sources(similar_records), "metadata": metadata}}
+        if not similar_records:
+            yield {"event": "token", "data": {"text": NO_CONTEXT_ANSWER}}
+        else:
+            stream = self.generator.stream_answer(
+                similar_records, query, use_cache=llm_cache is not False, metadata=metadata
+            )
+            started = False
+            chunks: List[str] = []
+            try:
+                while True:
+                    try:
+                        text = await deadline.run("generate", stream.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    chunks.append(text)
+                    yield {"event": "token", "data": {"text": text}}
+                if use_semantic_cache and "generation_error" not in metadata:
+                    self._semantic_store(embedding, query, namespace, {
+                        "answer": "".join(chunks).strip(),
+                        "sources": self._sources(similar_records),
+                        "metadata": metadata
+                    })
+            except DeadlineExceeded as e:
+                print(f"Answer stream cut short after {deadline.elapsed_ms():.0f}ms: {e}")
+                metadata.update(degraded=True, timed_out_stage=e.stage)
+                if not started:
+                    yield {"event": "token", "data": {"text": self._degraded_answer(similar_records)}}
+            finally:
+                await stream.aclose()
+        yield {"event": "done", "data": {"metadata": metadata}}
+
+    async def _retrieve_context(
+        self,
+        query: str,
+        embedding: Any,
+        retrieval_options: Optional[Dict[str, Any]],
+        rerank: Optional[bool],
+        rerank_budget_ms: Optional[float],
+        metadata: Dict[str, Any],
+        deadline: Deadline
+    ) -> List[Dict[str, Any]]:
+        """Retrieve records for the query embedding and optionally re-rank them to the top 3."""
+        rerank = RERANK_ENABLED if rerank is None else rerank
+        # A budget of 0 (or less) means no time for re-ranking: skip it
+        rerank_budget_ms = RERANK_BUDGET_MS if rerank_budget_ms is None else rerank_budget_ms
+        rerank = rerank and rerank_budget_ms > 0
+        
+        # Retrieve similar records from database
+        similar_records = await self._retrieve(
+            deadline, embedding, top_k=RERANK_CANDIDATES if rerank else 3, query_text=query,
+            **{**QUERY_SEARCH_SETTINGS, **(retrieval_options or {})}
+        )
+        print(f"Retrieved {len(similar_records)} similar records for answer generation")
+        
+        # Optional: re-rank the wider pool down to the top 3 within the budget;
+        # the re-ranker keeps the vector order when the budget runs out
+        if rerank and similar_records:
+            similar_records, metadata["reranked"] = await self.reranker.rerank(
+                query, similar_records, top_k=3,
+                budget_ms=deadline.budget_ms(rerank_budget_ms)
+            )
+        return similar_records
+
+    async def _retrieve(self, deadline: Deadline, embedding: Any, **options: Any) -> List[Dict[str, Any]]:
+        """
+        Retriever.get_similar_records with its SQL timeout capped by the time
+        left. A retrieval timeout (RETRIEVAL_TIMEOUT_MS or the deadline) is
+        raised as the retrieve stage running out of time rather than passed
+        on as "no matching records".
+        """
+        options.setdefault("timeout_ms", deadline.budget_ms(RETRIEVAL_TIMEOUT_MS))
+        retrieval: Dict[str, Any] = {}
+        records = await deadline.run(
+            "retrieve", self.retriever.get_similar_records(embedding, metadata=retrieval, **options)
+        )
+        if retrieval.get("timed_out"):
+            raise DeadlineExceeded("retrieve")
+        return records
+
+    def _degraded_answer(self, records: List[Dict[str, Any]]) -> str:
+        """Answer text when there was no time left to synthesize one: the insights themselves."""
+        if not records:
+            return TIMEOUT_ANSWER
+        insights = "\n".join(
+            f"- {record.get('description', record.get('suggestion', ''))}" for record in records[:3]
+        )
+        return f"{DEGRADED_ANSWER_INTRO}\n{insights}"
+
+    def _coalescing_key(self, endpoint: str, query: str, **options: Any) -> str:
+        """Requests with equal keys are interchangeable and can share one result."""
+        return json.dumps([endpoint, normalize_query(query), options], sort_keys=True, default=str)
+
+    def _semantic_namespace(self, retrieval_options: Optional[Dict[str, Any]], rerank: Optional[bool]) -> str:
+        """Options that change the answer; cached answers only match within one."""
+        return json.dumps(
+            {"retrieval": retrieval_options or {}, "rerank": RERANK_ENABLED if rerank is None else rerank},
+            sort_keys=True, default=str
+        )
+
+    def _semantic_lookup(self, embedding: Any, namespace: str, metadata: Dict[str, Any]) -> Optional[Dict]:
+        """Return a cached answer_query result for a near-identical question, if any."""
+        if self._semantic_cache_version != self.retriever.data_version:
+            # transaction_insights changed since these answers were generated
+            self.semantic_cache.clear()
+            self._semantic_cache_version = self.retriever.data_version
+        match = self.semantic_cache.get(embedding, namespace)
+        if match is None:
+            metadata["semantic_cache"] = "miss"
+            return None
+        cached, matched_query, similarity = match
+        print(f"Semantic cache hit (similarity {similarity:.3f}): {matched_query}")
+        return {
+            "answer": cached["answer"],
+            "sources": [dict(source) for source in cached["sources"]],
+            "metadata": {
+                **cached["metadata"],
+                "semantic_cache": "hit",
+                "matched_query": matched_query,
+                "similarity": round(similarity, 4)
+            }
+        }
+
+    def _semantic_store(self, embedding: Any, query: str, namespace: str, result: Dict):
+        """Remember an answer_query result for later paraphrases."""
+        if self._semantic_cache_version != self.retriever.data_version:
+            return
+        # Per-call outcomes that don't apply when the stored answer is reused
+        excluded = ("semantic_cache", "llm_cache", "prompt_tokens")
+        metadata = {key: value for key, value in result["metadata"].items() if key not in excluded}
+        self.semantic_cache.set(
+            embedding, query,
+            {"answer": result["answer"], "sources": [dict(source) for source in result["sources"]], "metadata": metadata},
+            namespace
+        )
+
+    def _sources(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Source entries returned alongside an answer."""
+        return [
+            {
+                "id": record.get("id", "unknown"),
+                "title": record.get("description", "")[:100] + "..." if len(record.get("description", "")) > 100 else record.get("description", ""),
+                "confidence": record.get("confidence", 0.0)
             }
+            for record in records
+        ]
 
 # Create the supervisor instance
 supervisor_instance = Supervisor()
@@ -0,0 +1,238 @@
+import os
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+from db.connection import INSIGHTS_CHANNEL, connect_listener, parse_insights_payload
+
+load_dotenv()
+
+EMBEDDING_DIM = 384
+
+# Polling interval (seconds) for rows that arrive without a NOTIFY
+VECTOR_INDEX_POLL_INTERVAL = float(os.getenv("VECTOR_INDEX_POLL_INTERVAL", "30"))
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so a dot product equals cosine similarity."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class InMemoryVectorIndex:
+    """
+    In-process mirror of transaction_insights embeddings.
+    Rows live in a contiguous float32 matrix with normalized rows, so top-k is
+    one matrix-vector product plus argpartition. It is kept in sync
+    incrementally via LISTEN/NOTIFY on INSIGHTS_CHANNEL and by polling for
+    ids above the highest one loaded.
+    """
+    def __init__(self, dim: int = EMBEDDING_DIM, poll_interval: float = VECTOR_INDEX_POLL_INTERVAL):
+        self.dim = dim
+        self.poll_interval = poll_interval
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._descriptions: List[str] = []
+        self._positions: Dict[int, int] = {}
+        self._size = 0
+        self._last_id = 0
+        self._pool: Optional[asyncpg.Pool] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._pending_ids: set = set()
+        # Set by a NOTIFY without ids; served by the refresh loop like _pending_ids
+        self._pending_poll = False
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    async def start(self, pool: asyncpg.Pool):
+        """Load every embedded row and start incremental sync."""
+        self._pool = pool
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT id, description, embedding
+                FROM transaction_insights
+                WHERE embedding IS NOT NULL
+                ORDER BY id
+                """
+            )
+        self.upsert(rows)
+        print(f"In-memory vector index loaded {self._size} records")
+
+        try:
+            self._listener = await connect_listener()
+            await self._listener.add_listener(INSIGHTS_CHANNEL, self._on_notify)
+        except Exception as e:
+            # Polling still keeps the mirror fresh, just with more lag
+            print(f"Vector index LISTEN unavailable, relying on polling: {e}")
+            self._listener = None
+
+        if self.poll_interval > 0:
+            self._poll_task = asyncio.ensure_future(self._poll_loop())
+
+    async def stop(self):
+        """Stop incremental sync and release the listener connection."""
+        for task in (self._poll_task, self._refresh_task):
+            if task:
+                task.cancel()
+        self._poll_task = None
+        self._refresh_task = None
+        if self._listener:
+            await self._listener.close()
+            self._listener = None
+
+    def _ensure_capacity(self, needed: int):
+        """Grow the backing arrays geometrically to avoid a copy per insert."""
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 64)
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.zeros(new_capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._ids = matrix, ids
+
+    def upsert(self, rows: Iterable[Any]):
+        """Insert or replace rows given as mappings with id, description and embedding."""
+        rows = [row for row in rows if row['embedding'] is not None]
+        if not rows:
+            return
+        vectors = _normalize_rows(np.asarray([row['embedding'] for row in rows], dtype=np.float32))
+        self._ensure_capacity(self._size + len(rows))
+
+        for row, vector in zip(rows, vectors):
+            record_id = int(row['id'])
+            position = self._positions.get(record_id)
+            if position is None:
+                position = self._size
+                self._size += 1
+                self._positions[record_id] = position
+                self._descriptions.append(row['description'])
+            else:
+                self._descriptions[position] = row['description']
+            self._matrix[position] = vector
+            self._ids[position] = record_id
+            self._last_id = max(self._last_id, record_id)
+
+    def remove(self, ids: Iterable[int]):
+        """Remove rows by id, filling each hole with the last row."""
+        for record_id in ids:
+            position = self._positions.pop(int(record_id), None)
+            if position is None:
+                continue
+            last = self._size - 1
+            if position != last:
+                moved_id = int(self._ids[last])
+                self._matrix[position] = self._matrix[last]
+                self._ids[position] = moved_id
+                self._descriptions[position] = self._descriptions[last]
+                self._positions[moved_id] = position
+            self._descriptions.pop()
+            self._size -= 1
+
+    def _top_k(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Indices of the top_k scores in descending order."""
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        return candidates[np.argsort(-scores[candidates])]
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 3, with_embeddings: bool = False) -> List[Dict[str, Any]]:
+        """Return the top_k rows as dicts shaped like the SQL result rows."""
+        query = np.asarray(query_embedding, dtype=np.float32)[None, :]
+        return self.search_many(query, top_k, with_embeddings)[0]
+
+    def search_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 3,
+        with_embeddings: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        """Answer several queries with one matrix-matrix product."""
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        if self._size == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        scores = queries @ self._matrix[:self._size].T
+        results = []
+        for row_scores in scores:
+            rows = []
+            for i in self._top_k(row_scores, top_k):
+                row = {
+                    'id': int(self._ids[i]),
+                    'description': self._descriptions[i],
+                    'similarity_score': float(row_scores[i])
+                }
+                if with_embeddings:
+                    row['embedding'] = self._matrix[i].copy()
+                rows.append(row)
+            results.append(rows)
+        return results
+
+    def _on_notify(self, connection, pid, channel, payload):
+        """Queue ids from a NOTIFY payload and refresh them in the background."""
+        _, ids = parse_insights_payload(payload)
+        self._pending_ids.update(ids)
+        if not ids:
+            self._pending_poll = True
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh_pending())
+
+    async def _refresh_pending(self):
+        """
+        Re-read notified ids (upsert embedded rows, drop deleted or un-embedded
+        ones) and poll for new rows when a NOTIFY carried no ids, until nothing
+        is pending.
+        """
+        try:
+            while self._pending_ids or self._pending_poll:
+                if self._pending_poll:
+                    self._pending_poll = False
+                    await self.poll()
+                if not self._pending_ids:
+                    continue
+                ids, self._pending_ids = list(self._pending_ids), set()
+                async with self._pool.acquire() as conn:
+                    rows = await conn.fetch(
+                        """
+                        SELECT id, description, embedding
+                        FROM transaction_insights
+                        WHERE id = ANY($1::int[])
+                        """,
+                        ids
+                    )
+                self.upsert(rows)
+                present = {row['id'] for row in rows if row['embedding'] is not None}
+                self.remove(i for i in ids if i not in present)
+        except Exception as e:
+            print(f"Error refreshing in-memory vector index: {e}")
+
+    async def poll(self):
+        """Load rows with ids above the highest id seen so far."""
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT id, description, embedding
+                FROM transaction_insights
+                WHERE embedding IS NOT NULL AND id > $1
+                ORDER BY id
+                """,
+                self._last_id
+            )
+        if rows:
+            self.upsert(rows)
+            print(f"In-memory vector index synced {len(rows)} new records")
+
+    async def _poll_loop(self):
+        """Periodically pick up rows that were written without a NOTIFY."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"Error polling in-memory vector index: {e}")
@@ -1,4 +1,8 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional, Union
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from agents.supervisor_instance import supervisor
 
@@ -7,33 +11,129 @@ router = APIRouter()
 
 class QueryRequest(BaseModel):
     query: str
+    # Optional retrieval settings; unset fields fall back to server defaults
+    retrieval_mode: Optional[Literal["vector", "hybrid"]] = None
+    vector_weight: Optional[float] = None
+    text_weight: Optional[float] = None
+    diversify: Optional[bool] = None
+    mmr_lambda: Optional[float] = None
+    # Optional cross-encoder re-ranking (/query only); a budget of 0 skips it
+    rerank: Optional[bool] = None
+    rerank_budget_ms: Optional[float] = None
+    # /suggestions only: true rewrites the insights with the LLM, false returns
+    # them as retrieved; unset follows the server's SUGGESTIONS_MODE
+    polish: Optional[bool] = None
+    # Set to false to skip the LLM response cache for this request
+    llm_cache: Optional[bool] = None
+    # Set to false to skip the semantic answer cache (/query and /query/stream)
+    semantic_cache: Optional[bool] = None
+    # End-to-end time budget; unset uses the endpoint's default, 0 disables it
+    deadline_ms: Optional[float] = None
+    # Optional structured filters on transaction_insights
+    category: Optional[Union[str, List[str]]] = None
+    insight_type: Optional[Union[str, List[str]]] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    def filters(self) -> Dict[str, Any]:
+        """Collect the structured filters that were provided."""
+        filters = {
+            "category": self.category,
+            "insight_type": self.insight_type,
+            "min_amount": self.min_amount,
+            "max_amount": self.max_amount,
+            "created_after": self.created_after,
+            "created_before": self.created_before
+        }
+        return {key: value for key, value in filters.items() if value is not None}
+
+    def retrieval_options(self) -> Dict[str, Any]:
+        """Collect the per-request Retriever settings that were provided."""
+        options = {
+            "mode": self.retrieval_mode,
+            "vector_weight": self.vector_weight,
+            "text_weight": self.text_weight,
+            "mmr": self.diversify,
+            "mmr_lambda": self.mmr_lambda,
+            "filters": self.filters() or None
+        }
+        return {key: value for key, value in options.items() if value is not None}
 
 class SuggestionsResponse(BaseModel):
     suggestions: list[dict]
+    metadata: dict = {}
 
 @router.post("/suggestions", response_model=SuggestionsResponse)
 async def get_suggestions(request: QueryRequest):
     """Return top 3 relevant transaction insights for user selection."""
     try:
-        # Only retrieve top 3 relevant records, no LLM synthesis
-        suggestions = await supervisor.get_top_suggestions(request.query)
-        return SuggestionsResponse(suggestions=suggestions)
+        # Top 3 relevant records straight from retrieval unless LLM polishing is requested
+        metadata = {}
+        suggestions = await supervisor.get_top_suggestions(
+            request.query,
+            retrieval_options=request.retrieval_options(),
+            llm_cache=request.llm_cache,
+            polish=request.polish,
+            metadata=metadata,
+            deadline_ms=request.deadline_ms
+        )
+        return SuggestionsResponse(suggestions=suggestions, metadata=metadata)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 class QueryResponse(BaseModel):
     answer: str
     sources: list[dict]
+    metadata: dict = {}
 
 @router.post("/query", response_model=QueryResponse)
 async def query_endpoint(request: QueryRequest):
     """Return a synthesized answer and sources using the top 3 insights as context."""
     try:
-        result = await supervisor.answer_query(request.query)
-        return QueryResponse(answer=result["answer"], sources=result["sources"])
+        result = await supervisor.answer_query(
+            request.query,
+            retrieval_options=request.retrieval_options(),
+            rerank=request.rerank,
+            rerank_budget_ms=request.rerank_budget_ms,
+            llm_cache=request.llm_cache,
+            semantic_cache=request.semantic_cache,
+            deadline_ms=request.deadline_ms
+        )
+        return QueryResponse(
+            answer=result["answer"],
+            sources=result["sources"],
+            metadata=result.get("metadata", {})
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/query/stream")
+async def query_stream_endpoint(request: QueryRequest):
+    """
+    Stream the /query answer as Server-Sent Events: a "sources" event once
+    retrieval is done, "token" events as the answer is generated, then "done".
+    """
+    async def events():
+        async for event in supervisor.stream_answer_query(
+            request.query,
+            retrieval_options=request.retrieval_options(),
+            rerank=request.rerank,
+            rerank_budget_ms=request.rerank_budget_ms,
+            llm_cache=request.llm_cache,
+            semantic_cache=request.semantic_cache,
+            deadline_ms=request.deadline_ms
+        ):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 class AdvancedQueryRequest(BaseModel):
     messages: list[dict]  # Each message: {"role": str, "content": str}
 
@@ -91,6 +91,11 @@ async def root():
     """Health check endpoint."""
     return {"status": "ok", "message": "Agentic RAG System is running"}
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics: DB pool saturation and cache hit rates."""
+    return supervisor.get_metrics()
+
 @app.get("/health")
 async def health_check():
     """Detailed health check endpoint."""
@@ -28,9 +28,12 @@
 
 
 import os
-from typing import AsyncGenerator
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
 import asyncpg
 from dotenv import load_dotenv
+from pgvector.asyncpg import register_vector
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
 import asyncio
@@ -63,6 +66,46 @@ RAW_DATABASE_URL = get_database_url()
 # Create async PostgreSQL DSN (remove +asyncpg if present for asyncpg connections)
 ASYNC_PG_DSN = RAW_DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
 
+# Optional read replicas (comma-separated DSNs); reads are routed to a healthy,
+# least-busy replica and fall back to the primary
+DATABASE_REPLICA_URLS = [
+    url.strip().replace("postgresql+asyncpg://", "postgresql://")
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+def _optional_float(name: str) -> Optional[float]:
+    """Read an optional float setting from the environment."""
+    value = os.getenv(name)
+    return float(value) if value else None
+
+# Pool sizing and connection lifecycle
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_COMMAND_TIMEOUT = _optional_float("DB_COMMAND_TIMEOUT")
+DB_ACQUIRE_TIMEOUT = _optional_float("DB_ACQUIRE_TIMEOUT")
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))
+DB_MAX_QUERIES = int(os.getenv("DB_MAX_QUERIES", "50000"))
+
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "10"))
+# Replicas lagging further behind than this (seconds) stop receiving reads
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "30"))
+# After a write, replicas that haven't replayed it yet are polled this often
+# (seconds) so they rejoin the rotation as soon as they catch up
+DB_REPLICA_CATCHUP_INTERVAL = float(os.getenv("DB_REPLICA_CATCHUP_INTERVAL", "0.25"))
+
+# Errors meaning the connection itself failed rather than the query
+CONNECTION_ERRORS = (OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError)
+
+T = TypeVar("T")
+
+def parse_lsn(value: Optional[str]) -> Optional[int]:
+    """A pg_lsn such as '16/B374D848' as an integer WAL position."""
+    if not value:
+        return None
+    high, low = value.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
 # Create SQLAlchemy engine
 engine = create_async_engine(RAW_DATABASE_URL)
 
@@ -79,21 +122,390 @@ async def ensure_vector_extension():
         print(f"Error ensuring vector extension: {e}")
         raise
 
+async def init_connection(conn: asyncpg.Connection):
+    """
+    Register the binary pgvector codec so float32 NumPy arrays are sent and
+    received as binary vectors instead of text literals re-parsed by ::vector.
+    """
+    await register_vector(conn)
+
 async def get_db_connection() -> AsyncGenerator[asyncpg.Connection, None]:
-    """Create and yield a database connection."""
+    """Create and yield a connection to the primary (used for ingestion writes)."""
     conn = await asyncpg.connect(ASYNC_PG_DSN)
     try:
+        await init_connection(conn)
         yield conn
     finally:
         await conn.close()
 
-async def get_db_pool() -> asyncpg.Pool:
-    """Create and return a connection pool."""
-    return await asyncpg.create_pool(
-        ASYNC_PG_DSN,
-        min_size=1,
-        max_size=10
-    )
+async def get_db_pool(dsn: str = ASYNC_PG_DSN, **overrides: Any) -> asyncpg.Pool:
+    """Create and return a connection pool (the primary unless another DSN is given)."""
+    settings = {
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "command_timeout": DB_COMMAND_TIMEOUT,
+        "max_inactive_connection_lifetime": DB_MAX_INACTIVE_LIFETIME,
+        "max_queries": DB_MAX_QUERIES,
+        **overrides
+    }
+    return await asyncpg.create_pool(dsn, init=init_connection, **settings)
+
+async def warm_pool(pool: asyncpg.Pool):
+    """
+    Check out min_size connections at once and run a trivial query on each,
+    so the first requests after a deploy don't pay for connection setup.
+    """
+    connections = []
+    try:
+        for _ in range(pool.get_min_size()):
+            connections.append(await pool.acquire())
+        await asyncio.gather(*(conn.fetchval("SELECT 1") for conn in connections))
+    finally:
+        for conn in connections:
+            await pool.release(conn)
+
+class PoolMetrics:
+    """Acquire wait time, in-use count and timeouts for one pool."""
+    def __init__(self):
+        self.acquires = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_acquire(self, wait: float):
+        self.acquires += 1
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def record_release(self):
+        self.in_use -= 1
+
+    def snapshot(self, pool: Optional[asyncpg.Pool]) -> Dict[str, Any]:
+        """Counters plus the pool's current size, for the metrics endpoint."""
+        return {
+            "size": pool.get_size() if pool else 0,
+            "idle": pool.get_idle_size() if pool else 0,
+            "min_size": pool.get_min_size() if pool else 0,
+            "max_size": pool.get_max_size() if pool else 0,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "acquires": self.acquires,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "avg_wait_ms": round(self.total_wait / self.acquires * 1000, 3) if self.acquires else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3)
+        }
+
+class ReplicaPool:
+    """A read replica's pool plus the health state used for routing."""
+    def __init__(self, name: str, dsn: str):
+        self.name = name
+        self.dsn = dsn
+        self.pool: Optional[asyncpg.Pool] = None
+        self.healthy = False
+        self.lag: Optional[float] = None
+        # WAL position replayed as of the last check
+        self.replay_lsn = 0
+        self.last_error: Optional[str] = None
+        self.metrics = PoolMetrics()
+
+    def load(self) -> float:
+        """Fraction of the pool's connections currently checked out."""
+        if self.pool is None:
+            return 1.0
+        in_use = self.pool.get_size() - self.pool.get_idle_size()
+        return in_use / max(1, self.pool.get_max_size())
+
+class DatabaseRouter:
+    """
+    Primary pool plus any number of read-replica pools.
+    acquire(readonly=True) picks the least-busy healthy replica and falls back
+    to the primary; writes (readonly=False) always go to the primary.
+    Replica health and replication lag are checked in the background.
+    After require_lsn(lsn) (a write seen via NOTIFY), replicas only receive
+    reads once they have replayed up to lsn, so a read that follows a cache
+    invalidation never sees the data from before the write.
+    """
+    def __init__(self, primary_dsn: str = ASYNC_PG_DSN, replica_dsns: Optional[List[str]] = None):
+        self.primary_dsn = primary_dsn
+        self.primary: Optional[asyncpg.Pool] = None
+        self.replicas = [
+            ReplicaPool(f"replica-{i}", dsn)
+            for i, dsn in enumerate(DATABASE_REPLICA_URLS if replica_dsns is None else replica_dsns)
+        ]
+        self.primary_metrics = PoolMetrics()
+        self._health_task: Optional[asyncio.Task] = None
+        # Replicas must have replayed this WAL position to serve reads
+        self.min_lsn = 0
+        # Writes whose WAL position is still being looked up; reads stay on the primary
+        self._pending_lsn_lookups = 0
+        self._catch_up_task: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+
+    async def initialize(self):
+        """Create the primary pool (required) and replica pools (best effort)."""
+        self.primary = await get_db_pool(self.primary_dsn)
+        for replica in self.replicas:
+            try:
+                # Same ping and lag check as the health loop
+                await self._check_replica(replica)
+                replica.healthy = True
+            except Exception as e:
+                replica.last_error = str(e)
+                print(f"Read replica {replica.name} unavailable: {e}")
+        if self.replicas and DB_HEALTH_CHECK_INTERVAL > 0:
+            self._health_task = asyncio.ensure_future(self._health_loop())
+        print(f"Database router ready (primary + {sum(r.healthy for r in self.replicas)} healthy replicas)")
+
+    async def warm(self):
+        """Pre-fill every pool to min_size with connections that have run a query."""
+        await warm_pool(self.primary)
+        for replica in self.replicas:
+            if replica.healthy and replica.pool is not None:
+                try:
+                    await warm_pool(replica.pool)
+                except Exception as e:
+                    self._mark_unhealthy(replica, e)
+        print("Database pools warmed")
+
+    def _choose(self, readonly: bool) -> Tuple[asyncpg.Pool, Optional[ReplicaPool]]:
+        """Pick the pool for this acquire."""
+        if readonly and not self._pending_lsn_lookups:
+            candidates = [
+                r for r in self.replicas
+                if r.healthy and r.pool is not None and r.replay_lsn >= self.min_lsn
+            ]
+            if candidates:
+                replica = min(candidates, key=lambda r: r.load())
+                return replica.pool, replica
+        return self.primary, None
+
+    def _mark_unhealthy(self, replica: ReplicaPool, error: Exception):
+        """Take a replica out of rotation until the health check passes again."""
+        replica.healthy = False
+        replica.last_error = str(error)
+        print(f"Read replica {replica.name} marked unhealthy: {error}")
+
+    async def _timed_acquire(self, pool: asyncpg.Pool, metrics: PoolMetrics, timeout: Optional[float]) -> asyncpg.Connection:
+        """Acquire from a pool, recording wait time, timeouts and errors."""
+        start = time.perf_counter()
+        try:
+            conn = await pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            raise
+        except Exception:
+            metrics.errors += 1
+            raise
+        metrics.record_acquire(time.perf_counter() - start)
+        return conn
+
+    @asynccontextmanager
+    async def acquire(self, readonly: bool = True, timeout: Optional[float] = DB_ACQUIRE_TIMEOUT) -> AsyncIterator[asyncpg.Connection]:
+        """Acquire a connection, routing reads to replicas when available."""
+        pool, replica = self._choose(readonly)
+        metrics = replica.metrics if replica else self.primary_metrics
+        try:
+            conn = await self._timed_acquire(pool, metrics, timeout)
+        except CONNECTION_ERRORS as e:
+            if replica is None:
+                raise
+            self._mark_unhealthy(replica, e)
+            pool, metrics = self.primary, self.primary_metrics
+            conn = await self._timed_acquire(pool, metrics, timeout)
+        try:
+            yield conn
+        finally:
+            metrics.record_release()
+            await pool.release(conn)
+
+    async def read(
+        self,
+        fn: Callable[[asyncpg.Connection], Awaitable[T]],
+        timeout: Optional[float] = DB_ACQUIRE_TIMEOUT
+    ) -> T:
+        """
+        Run fn(conn) on a read connection. If a replica's connection fails
+        mid-query, the replica leaves the rotation at once and fn is re-run
+        on the primary.
+        """
+        pool, replica = self._choose(readonly=True)
+        if replica is not None:
+            try:
+                conn = await self._timed_acquire(pool, replica.metrics, timeout)
+            except CONNECTION_ERRORS as e:
+                self._mark_unhealthy(replica, e)
+            else:
+                try:
+                    return await fn(conn)
+                except CONNECTION_ERRORS as e:
+                    self._mark_unhealthy(replica, e)
+                finally:
+                    replica.metrics.record_release()
+                    await pool.release(conn)
+        async with self.acquire(readonly=False, timeout=timeout) as conn:
+            return await fn(conn)
+
+    def require_lsn(self, lsn: Optional[int]):
+        """
+        Keep reads off replicas until they have replayed WAL position lsn.
+        None stands for the primary's current position, which is looked up
+        first; reads stay on the primary until it is known.
+        """
+        if not self.replicas:
+            return
+        if lsn is None:
+            self._pending_lsn_lookups += 1
+            task = asyncio.ensure_future(self._lookup_lsn())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+        self.min_lsn = max(self.min_lsn, lsn)
+        if self._catch_up_task is None or self._catch_up_task.done():
+            self._catch_up_task = asyncio.ensure_future(self._catch_up())
+
+    async def _lookup_lsn(self):
+        """Resolve require_lsn(None) to the primary's current WAL position."""
+        try:
+            lsn = parse_lsn(await self.primary.fetchval("SELECT pg_current_wal_lsn()::text"))
+        except Exception as e:
+            print(f"Could not read the primary's WAL position: {e}")
+            # Without it, make every replica advance past the furthest position seen so far
+            lsn = max((replica.replay_lsn for replica in self.replicas), default=0) + 1
+        finally:
+            self._pending_lsn_lookups -= 1
+        self.require_lsn(lsn)
+
+    async def _catch_up(self):
+        """Poll replicas behind min_lsn until each has replayed it (or is unhealthy)."""
+        while True:
+            lagging = [
+                r for r in self.replicas
+                if r.healthy and r.pool is not None and r.replay_lsn < self.min_lsn
+            ]
+            if not lagging:
+                return
+            await asyncio.sleep(DB_REPLICA_CATCHUP_INTERVAL)
+            for replica in lagging:
+                try:
+                    await self._check_replica(replica)
+                except Exception as e:
+                    self._mark_unhealthy(replica, e)
+
+    async def _check_replica(self, replica: ReplicaPool):
+        """Ping a replica and measure its replay lag and position."""
+        if replica.pool is None:
+            replica.pool = await get_db_pool(replica.dsn)
+        async with replica.pool.acquire(timeout=5) as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT
+                    CASE
+                        WHEN NOT pg_is_in_recovery() THEN 0
+                        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                    END AS lag,
+                    CASE
+                        WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()
+                        ELSE pg_current_wal_lsn()
+                    END::text AS replay_lsn
+                """
+            )
+        replica.lag = float(row['lag'])
+        replica.replay_lsn = parse_lsn(row['replay_lsn']) or 0
+        if replica.lag > DB_REPLICA_MAX_LAG:
+            raise RuntimeError(f"replication lag {replica.lag:.1f}s exceeds {DB_REPLICA_MAX_LAG}s")
+
+    async def _health_loop(self):
+        """Periodically re-check every replica and update routing."""
+        while True:
+            await asyncio.sleep(DB_HEALTH_CHECK_INTERVAL)
+            for replica in self.replicas:
+                try:
+                    await self._check_replica(replica)
+                    if not replica.healthy:
+                        print(f"Read replica {replica.name} back in rotation")
+                    replica.healthy = True
+                    replica.last_error = None
+                except Exception as e:
+                    if replica.healthy:
+                        self._mark_unhealthy(replica, e)
+
+    def status(self) -> Dict[str, Any]:
+        """Routing state and saturation metrics per pool."""
+        status = {"primary": {"healthy": self.primary is not None, **self.primary_metrics.snapshot(self.primary)}}
+        for replica in self.replicas:
+            status[replica.name] = {
+                "healthy": replica.healthy,
+                "lag": replica.lag,
+                "caught_up": replica.replay_lsn >= self.min_lsn,
+                "last_error": replica.last_error,
+                **replica.metrics.snapshot(replica.pool)
+            }
+        return status
+
+    async def close(self):
+        """Stop health checks and close every pool."""
+        for task in (self._health_task, self._catch_up_task, *self._tasks):
+            if task:
+                task.cancel()
+        self._health_task = None
+        self._catch_up_task = None
+        for replica in self.replicas:
+            if replica.pool:
+                await replica.pool.close()
+                replica.pool = None
+        if self.primary:
+            await self.primary.close()
+            self.primary = None
+
+# NOTIFY channel fired when transaction_insights rows are written. The
+# payload is "<primary WAL position>;<comma-separated changed ids>"; either
+# part may be empty (no ids = unknown rows).
+INSIGHTS_CHANNEL = "transaction_insights_changed"
+
+# Postgres caps NOTIFY payloads at 8000 bytes
+MAX_NOTIFY_PAYLOAD = 7900
+
+async def connect_listener() -> asyncpg.Connection:
+    """Open a dedicated connection for LISTEN (kept out of the pool)."""
+    conn = await asyncpg.connect(ASYNC_PG_DSN)
+    await init_connection(conn)
+    return conn
+
+def parse_insights_payload(payload: Optional[str]) -> Tuple[Optional[int], List[int]]:
+    """Split an INSIGHTS_CHANNEL payload into (WAL position, changed ids)."""
+    lsn, _, ids = (payload or "").rpartition(";")
+    return parse_lsn(lsn), [int(x) for x in ids.split(",") if x.strip()]
+
+async def notify_insights_changed(conn: asyncpg.Connection, ids: Optional[Iterable[int]] = None):
+    """
+    Tell in-process mirrors and caches that transaction_insights rows changed.
+    Call it on the primary after the writes have committed: the payload
+    carries the current WAL position, which replicas must replay before
+    they serve reads again.
+    """
+    lsn = await conn.fetchval("SELECT pg_current_wal_lsn()::text")
+    prefix = f"{lsn};"
+    if ids is None:
+        await conn.execute("SELECT pg_notify($1, $2)", INSIGHTS_CHANNEL, prefix)
+        return
+
+    payload = ""
+    for record_id in ids:
+        item = str(record_id)
+        if payload and len(prefix) + len(payload) + len(item) + 1 > MAX_NOTIFY_PAYLOAD:
+            await conn.execute("SELECT pg_notify($1, $2)", INSIGHTS_CHANNEL, prefix + payload)
+            payload = ""
+        payload = f"{payload},{item}" if payload else item
+    if payload:
+        await conn.execute("SELECT pg_notify($1, $2)", INSIGHTS_CHANNEL, prefix + payload)
 
 # Usage example: run this file directly to ensure the extension exists
 if __name__ == "__main__":
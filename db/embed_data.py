@@ -1,7 +1,8 @@
 import asyncio
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from connection import get_db_connection
+from connection import get_db_connection, notify_insights_changed
+from indexes import QUANTIZED_COLUMNS, get_quantized_columns
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,6 +15,13 @@ async def generate_and_store_embeddings():
     model = SentenceTransformer(Model_name)
     
     async for conn in get_db_connection():
+        # Keep any compact representations (see db/indexes.py quantize) in step
+        quantized_updates = "".join(
+            f", {QUANTIZED_COLUMNS[kind]['column']} = "
+            + QUANTIZED_COLUMNS[kind]['expression'].format(source="$1::vector(384)")
+            for kind in await get_quantized_columns(conn)
+        )
+        
         # Fetch all records that don't have embeddings
         records = await conn.fetch(
             """
@@ -26,22 +34,25 @@ async def generate_and_store_embeddings():
             # Generate embedding
             text_embedding = model.encode(record['description'])
             
-            # Convert numpy array to list and from list to str in PostgreSQL format expected for a vector, then store in database
-            embedding_list = text_embedding.tolist()
-            embedding_str = f"[{', '.join(str(x) for x in embedding_list)}]"
+            # Sent as a binary float32 vector by the pgvector codec on the connection
+            embedding = np.asarray(text_embedding, dtype=np.float32)
             
             # Update the record with the embedding
             await conn.execute(
-                """
+                f"""
                 UPDATE transaction_insights 
-                SET embedding = $1::vector(384)
+                SET embedding = $1::vector(384){quantized_updates}
                 WHERE id = $2
                 """,
-                embedding_str,
+                embedding,
                 record['id']
             )
             
             print(f"Generated and stored embedding for record {record['id']}")
 
+        # Let in-process vector mirrors pick up the new embeddings
+        if records:
+            await notify_insights_changed(conn, [record['id'] for record in records])
+
 if __name__ == "__main__":
     asyncio.run(generate_and_store_embeddings())
@@ -0,0 +1,369 @@
+import os
+import re
+import hashlib
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+import asyncpg
+from dotenv import load_dotenv
+
+try:
+    from db.connection import get_db_connection
+except ModuleNotFoundError as e:
+    # Allow running this file directly from inside db/, like embed_data.py;
+    # any other import error (e.g. a missing dependency) is a real failure
+    if e.name != "db":
+        raise
+    from connection import get_db_connection
+
+load_dotenv()
+
+TABLE_NAME = "transaction_insights"
+EMBEDDING_COLUMN = "embedding"
+
+# ANN index defaults (overridable per call)
+VECTOR_INDEX_METHOD = os.getenv("VECTOR_INDEX_METHOD", "hnsw").lower()
+VECTOR_INDEX_NAME = os.getenv("VECTOR_INDEX_NAME", f"{TABLE_NAME}_{EMBEDDING_COLUMN}_idx")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+INDEX_MAINTENANCE_WORK_MEM = os.getenv("INDEX_MAINTENANCE_WORK_MEM")
+
+# Full-text search column backing hybrid (lexical + vector) retrieval
+TSVECTOR_COLUMN = "description_tsv"
+FULLTEXT_CONFIG = "english"
+FULLTEXT_INDEX_NAME = f"{TABLE_NAME}_{TSVECTOR_COLUMN}_idx"
+
+# Compact representations stored alongside the full-precision embedding:
+# "halfvec" keeps 16-bit floats (half the size), "binary" keeps one bit per
+# dimension (1/32 of the size) and is searched by Hamming distance.
+# "expression" derives the compact value from a full-precision {source}.
+EMBEDDING_DIM = 384
+QUANTIZED_COLUMNS = {
+    "halfvec": {
+        "column": "embedding_half",
+        "type": f"halfvec({EMBEDDING_DIM})",
+        "expression": "{source}::halfvec(%d)" % EMBEDDING_DIM,
+        "opclass": "halfvec_cosine_ops",
+        "operator": "<=>"
+    },
+    "binary": {
+        "column": "embedding_bits",
+        "type": f"bit({EMBEDDING_DIM})",
+        "expression": "binary_quantize({source})::bit(%d)" % EMBEDDING_DIM,
+        "opclass": "bit_hamming_ops",
+        "operator": "<~>"
+    }
+}
+
+# Categories smaller than this are cheap to scan exactly and get no partial index
+PARTIAL_INDEX_MIN_ROWS = int(os.getenv("PARTIAL_INDEX_MIN_ROWS", "1000"))
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def _ident(name: str) -> str:
+    """Validate an SQL identifier coming from configuration."""
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid SQL identifier: {name!r}")
+    return name
+
+async def create_vector_index(
+    conn: asyncpg.Connection,
+    method: str = VECTOR_INDEX_METHOD,
+    name: str = VECTOR_INDEX_NAME,
+    m: int = HNSW_M,
+    ef_construction: int = HNSW_EF_CONSTRUCTION,
+    lists: int = IVFFLAT_LISTS,
+    opclass: str = "vector_cosine_ops",
+    concurrently: bool = True
+):
+    """
+    Create an HNSW or IVFFlat index on the embedding column.
+    The cosine operator class matches the retriever's <=> ordering.
+    """
+    method = method.lower()
+    if method == "hnsw":
+        options = f"(m = {int(m)}, ef_construction = {int(ef_construction)})"
+    elif method == "ivfflat":
+        options = f"(lists = {int(lists)})"
+    else:
+        raise ValueError(f"Unknown vector index method '{method}', expected 'hnsw' or 'ivfflat'")
+
+    if INDEX_MAINTENANCE_WORK_MEM:
+        # Index builds are much faster when the graph fits in maintenance_work_mem
+        await conn.execute(f"SET maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+
+    await conn.execute(
+        f"""
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {_ident(name)}
+        ON {TABLE_NAME} USING {method} ({EMBEDDING_COLUMN} {_ident(opclass)})
+        WITH {options}
+        """
+    )
+    print(f"Vector index {name} ({method} {options}) created")
+
+async def rebuild_vector_index(conn: asyncpg.Connection, name: str = VECTOR_INDEX_NAME, concurrently: bool = True):
+    """Rebuild an existing vector index, e.g. after bulk ingestion shifted the data distribution."""
+    if INDEX_MAINTENANCE_WORK_MEM:
+        await conn.execute(f"SET maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+    await conn.execute(f"REINDEX INDEX {'CONCURRENTLY ' if concurrently else ''}{_ident(name)}")
+    print(f"Vector index {name} rebuilt")
+
+async def drop_vector_index(conn: asyncpg.Connection, name: str = VECTOR_INDEX_NAME, concurrently: bool = True):
+    """Drop a vector index, e.g. before switching between HNSW and IVFFlat."""
+    await conn.execute(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {_ident(name)}")
+    print(f"Vector index {name} dropped")
+
+async def ensure_fulltext_search(conn: asyncpg.Connection, name: str = FULLTEXT_INDEX_NAME, concurrently: bool = True):
+    """
+    Add the generated description_tsv column used by hybrid retrieval and
+    index it with GIN. Adding a stored generated column rewrites the table once.
+    """
+    await conn.execute(
+        f"""
+        ALTER TABLE {TABLE_NAME}
+        ADD COLUMN IF NOT EXISTS {TSVECTOR_COLUMN} tsvector
+        GENERATED ALWAYS AS (to_tsvector('{FULLTEXT_CONFIG}', coalesce(description, ''))) STORED
+        """
+    )
+    await conn.execute(
+        f"""
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {_ident(name)}
+        ON {TABLE_NAME} USING gin ({TSVECTOR_COLUMN})
+        """
+    )
+    print(f"Full-text column {TSVECTOR_COLUMN} and index {name} ensured")
+
+async def create_filter_indexes(conn: asyncpg.Connection, concurrently: bool = True):
+    """
+    B-tree indexes for the retriever's structured filters. When a filter is
+    selective the planner can use these and sort the few survivors exactly
+    instead of post-filtering a large ANN candidate set.
+    """
+    statements = [
+        (f"{TABLE_NAME}_category_type_created_idx", "(category, insight_type, created_at)"),
+        (f"{TABLE_NAME}_insight_type_idx", "(insight_type)"),
+        (f"{TABLE_NAME}_amount_idx", "(amount)"),
+        (f"{TABLE_NAME}_created_at_idx", "(created_at)")
+    ]
+    for name, columns in statements:
+        await conn.execute(
+            f"""
+            CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {_ident(name)}
+            ON {TABLE_NAME} {columns}
+            WHERE {EMBEDDING_COLUMN} IS NOT NULL
+            """
+        )
+        print(f"Filter index {name} ensured")
+
+# Postgres truncates identifiers longer than this many bytes
+MAX_IDENTIFIER_BYTES = 63
+
+def partial_index_name(category: str) -> str:
+    """
+    Name of a category's partial vector index: a readable slug plus a hash of
+    the exact category, so categories that slug alike (or share a long
+    prefix) never collide, kept within Postgres's identifier limit.
+    """
+    digest = hashlib.md5(category.encode("utf-8")).hexdigest()[:8]
+    prefix = f"{TABLE_NAME}_{EMBEDDING_COLUMN}_"
+    suffix = f"_{digest}_idx"
+    slug = re.sub(r"[^a-z0-9_]", "_", category.lower())
+    return prefix + slug[:max(0, MAX_IDENTIFIER_BYTES - len(prefix) - len(suffix))] + suffix
+
+async def create_partial_vector_indexes(
+    conn: asyncpg.Connection,
+    method: str = VECTOR_INDEX_METHOD,
+    min_rows: int = PARTIAL_INDEX_MIN_ROWS,
+    concurrently: bool = True
+):
+    """
+    Create one partial ANN index per category. The retriever inlines a single
+    category filter as a literal when it is one of these categories (see
+    get_partial_index_categories), so the planner can match the index and run
+    a filtered ANN search that never sees rows from other categories.
+    """
+    categories = await conn.fetch(
+        f"""
+        SELECT category, COUNT(*) AS rows
+        FROM {TABLE_NAME}
+        WHERE category IS NOT NULL AND {EMBEDDING_COLUMN} IS NOT NULL
+        GROUP BY category
+        HAVING COUNT(*) >= $1
+        ORDER BY category
+        """,
+        min_rows
+    )
+    for row in categories:
+        literal = "'" + row['category'].replace("'", "''") + "'"
+        name = partial_index_name(row['category'])
+        if method == "ivfflat":
+            using = f"ivfflat ({EMBEDDING_COLUMN} vector_cosine_ops) WITH (lists = {max(1, row['rows'] // 1000)})"
+        else:
+            using = f"hnsw ({EMBEDDING_COLUMN} vector_cosine_ops) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+        await conn.execute(
+            f"""
+            CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {_ident(name)}
+            ON {TABLE_NAME} USING {using}
+            WHERE category = {literal}
+            """
+        )
+        print(f"Partial vector index {name} ensured ({row['rows']} rows)")
+
+async def ensure_quantized_column(conn: asyncpg.Connection, kind: str, concurrently: bool = True):
+    """
+    Add a compact copy of the embedding (halfvec or binary), backfill it from
+    the full-precision column and build an HNSW index on it for coarse search.
+    """
+    if kind not in QUANTIZED_COLUMNS:
+        raise ValueError(f"Unknown quantization '{kind}', expected one of {', '.join(QUANTIZED_COLUMNS)}")
+    spec = QUANTIZED_COLUMNS[kind]
+
+    await conn.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN IF NOT EXISTS {spec['column']} {spec['type']}")
+    updated = await conn.execute(
+        f"""
+        UPDATE {TABLE_NAME}
+        SET {spec['column']} = {spec['expression'].format(source=EMBEDDING_COLUMN)}
+        WHERE {EMBEDDING_COLUMN} IS NOT NULL AND {spec['column']} IS NULL
+        """
+    )
+    print(f"Quantized column {spec['column']} backfilled ({updated})")
+
+    name = f"{TABLE_NAME}_{spec['column']}_idx"
+    if INDEX_MAINTENANCE_WORK_MEM:
+        await conn.execute(f"SET maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+    await conn.execute(
+        f"""
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {_ident(name)}
+        ON {TABLE_NAME} USING hnsw ({spec['column']} {spec['opclass']})
+        WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})
+        """
+    )
+    print(f"Quantized vector index {name} ensured")
+
+async def get_quantized_columns(conn: asyncpg.Connection) -> List[str]:
+    """Return which quantized columns exist on transaction_insights."""
+    rows = await conn.fetch(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = $1 AND column_name = ANY($2::text[])
+        """,
+        TABLE_NAME,
+        [spec['column'] for spec in QUANTIZED_COLUMNS.values()]
+    )
+    present = {row['column_name'] for row in rows}
+    return [kind for kind, spec in QUANTIZED_COLUMNS.items() if spec['column'] in present]
+
+_CATEGORY_PREDICATE = re.compile(r"^\(category = '((?:[^']|'')*)'::(?:text|character varying)\)$")
+
+async def get_partial_index_categories(conn: asyncpg.Connection) -> List[str]:
+    """Return the categories that have a valid partial vector index."""
+    rows = await conn.fetch(
+        """
+        SELECT pg_get_expr(i.indpred, i.indrelid) AS predicate
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.indrelid = $1::regclass
+          AND i.indisvalid
+          AND i.indpred IS NOT NULL
+          AND am.amname IN ('hnsw', 'ivfflat')
+        """,
+        TABLE_NAME
+    )
+    categories = []
+    for row in rows:
+        match = _CATEGORY_PREDICATE.match(row['predicate'] or "")
+        if match:
+            categories.append(match.group(1).replace("''", "'"))
+    return sorted(categories)
+
+async def get_index_status(conn: asyncpg.Connection) -> List[Dict[str, Any]]:
+    """
+    Report every index on transaction_insights with its validity, size and,
+    for builds in progress, the current phase and progress counters.
+    """
+    indexes = await conn.fetch(
+        """
+        SELECT
+            c.relname AS name,
+            am.amname AS method,
+            i.indisvalid AS valid,
+            i.indisready AS ready,
+            pg_relation_size(c.oid) AS size_bytes,
+            pg_get_indexdef(c.oid) AS definition
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.indrelid = $1::regclass
+        ORDER BY c.relname
+        """,
+        TABLE_NAME
+    )
+    progress = await conn.fetch(
+        """
+        SELECT
+            p.index_relid::regclass::text AS name,
+            p.phase,
+            p.blocks_done,
+            p.blocks_total,
+            p.tuples_done,
+            p.tuples_total
+        FROM pg_stat_progress_create_index p
+        WHERE p.relid = $1::regclass
+        """,
+        TABLE_NAME
+    )
+    in_progress = {row['name']: dict(row) for row in progress}
+
+    status = []
+    for row in indexes:
+        entry = dict(row)
+        build = in_progress.get(row['name'])
+        entry['build'] = {k: v for k, v in build.items() if k != 'name'} if build else None
+        status.append(entry)
+    return status
+
+async def main(args: Optional[List[str]] = None):
+    """Command-line entry point: manage the vector, full-text, filter and quantized indexes or inspect them."""
+    parser = argparse.ArgumentParser(description="Manage search indexes on transaction_insights")
+    parser.add_argument("action", choices=["create", "rebuild", "drop", "fulltext", "filters", "quantize", "status"])
+    parser.add_argument("--method", default=VECTOR_INDEX_METHOD, choices=["hnsw", "ivfflat"])
+    parser.add_argument("--name", default=VECTOR_INDEX_NAME)
+    parser.add_argument("--m", type=int, default=HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--lists", type=int, default=IVFFLAT_LISTS)
+    parser.add_argument("--partial", action="store_true", help="With 'filters', also build per-category vector indexes")
+    parser.add_argument("--kind", default="halfvec", choices=list(QUANTIZED_COLUMNS), help="With 'quantize', the compact representation to add")
+    parser.add_argument("--blocking", action="store_true", help="Build without CONCURRENTLY (faster, locks writes)")
+    options = parser.parse_args(args)
+
+    async for conn in get_db_connection():
+        if options.action == "create":
+            await create_vector_index(
+                conn,
+                method=options.method,
+                name=options.name,
+                m=options.m,
+                ef_construction=options.ef_construction,
+                lists=options.lists,
+                concurrently=not options.blocking
+            )
+        elif options.action == "rebuild":
+            await rebuild_vector_index(conn, name=options.name, concurrently=not options.blocking)
+        elif options.action == "drop":
+            await drop_vector_index(conn, name=options.name, concurrently=not options.blocking)
+        elif options.action == "fulltext":
+            await ensure_fulltext_search(conn, concurrently=not options.blocking)
+        elif options.action == "filters":
+            await create_filter_indexes(conn, concurrently=not options.blocking)
+            if options.partial:
+                await create_partial_vector_indexes(conn, method=options.method, concurrently=not options.blocking)
+        elif options.action == "quantize":
+            await ensure_quantized_column(conn, options.kind, concurrently=not options.blocking)
+
+        for index in await get_index_status(conn):
+            print(index)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# ===== QUANTIZED RETRIEVAL BENCHMARK =====
+# Compares storage size, recall@k and latency of the full-precision embedding
+# column against the compact halfvec / binary columns (with exact re-ranking).
+# Prepare the columns first: python -m db.indexes quantize --kind halfvec|binary
+import asyncio
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from db.connection import get_db_connection
+from db.indexes import QUANTIZED_COLUMNS, TABLE_NAME, get_quantized_columns
+from agents.retriever import Retriever
+
+TOP_K = int(os.getenv("BENCHMARK_TOP_K", "10"))
+SAMPLE_QUERIES = int(os.getenv("BENCHMARK_QUERIES", "100"))
+
+async def column_sizes(conn, columns):
+    """Return total on-disk bytes per column and for each column's indexes."""
+    sizes = {}
+    for column in columns:
+        sizes[column] = await conn.fetchval(
+            f"SELECT COALESCE(SUM(pg_column_size({column})), 0) FROM {TABLE_NAME}"
+        )
+        sizes[f"{column} index"] = await conn.fetchval(
+            """
+            SELECT COALESCE(SUM(pg_relation_size(i.indexrelid)), 0)
+            FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = $1::regclass AND a.attname = $2
+            """,
+            TABLE_NAME, column
+        )
+    return sizes
+
+async def exact_neighbours(conn, query_vector):
+    """Exact top-k ids by sequential scan (index scans disabled)."""
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_indexscan = off")
+        rows = await conn.fetch(
+            f"""
+            SELECT id FROM {TABLE_NAME}
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <=> $1::vector
+            LIMIT $2
+            """,
+            query_vector, TOP_K
+        )
+    return {row['id'] for row in rows}
+
+async def run_benchmark():
+    """Measure memory saved and recall kept for every available representation."""
+    async for conn in get_db_connection():
+        kinds = await get_quantized_columns(conn)
+        if not kinds:
+            print("✗ No quantized columns found. Run: python -m db.indexes quantize --kind halfvec")
+            return False
+
+        columns = ["embedding"] + [QUANTIZED_COLUMNS[kind]['column'] for kind in kinds]
+        sizes = await column_sizes(conn, columns)
+        print("Storage:")
+        for name, size in sizes.items():
+            ratio = size / sizes["embedding"] if sizes["embedding"] else 0.0
+            print(f"  {name:<28} {size / 1024 / 1024:8.2f} MiB ({ratio:.1%} of embedding)")
+
+        # Use stored embeddings as queries so no model is needed
+        samples = await conn.fetch(
+            f"SELECT embedding FROM {TABLE_NAME} WHERE embedding IS NOT NULL ORDER BY random() LIMIT $1",
+            SAMPLE_QUERIES
+        )
+        ground_truth = [await exact_neighbours(conn, row['embedding']) for row in samples]
+
+    retriever = Retriever(backend="sql")
+    await retriever.initialize()
+    try:
+        print(f"\nRecall@{TOP_K} over {len(samples)} queries:")
+        for kind in ["none"] + kinds:
+            recalls, latencies = [], []
+            for row, expected in zip(samples, ground_truth):
+                start = time.perf_counter()
+                results = await retriever.get_similar_records(
+                    row['embedding'], top_k=TOP_K, quantization=kind, use_cache=False
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                found = {record['id'] for record in results}
+                recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"  {kind:<8} recall={sum(recalls) / len(recalls):.3f}  p50={p50:.2f}ms  p99={p99:.2f}ms")
+    finally:
+        await retriever.close()
+
+    return True
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
@@ -0,0 +1,70 @@
+# ===== RESPONSE CACHE TESTS =====
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.cache import LRUCache, SQLiteCache
+
+
+def test_sqlite_async_calls_run_off_the_event_loop(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    threads = []
+    original_get = cache.get
+
+    def recording_get(key, default=None):
+        threads.append(threading.current_thread().name)
+        return original_get(key, default)
+
+    cache.get = recording_get
+
+    async def scenario():
+        await cache.aset("key", {"answer": "cached"})
+        return await cache.aget("key"), await cache.aget("missing", "default")
+
+    try:
+        assert asyncio.run(scenario()) == ({"answer": "cached"}, "default")
+    finally:
+        cache.close()
+    assert threads and all(name.startswith("sqlite-cache") for name in threads)
+
+
+def test_sqlite_evicts_least_recently_used_in_batches(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_size=10, touch_batch=3, evict_to=0.9)
+    for i in range(10):
+        cache.set(i, i)
+    for key in (0, 1, 2):
+        assert cache.get(key) == key
+    cache.set(10, 10)
+
+    # Trimmed to 9 entries: the two least recently used (3 and 4) are gone
+    assert len(cache) == 9
+    assert cache.stats()["evictions"] == 2
+    assert cache.get(3) is None and cache.get(4) is None
+    assert cache.get(0) == 0 and cache.get(10) == 10
+    cache.close()
+
+
+def test_sqlite_entries_and_recency_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SQLiteCache(path, touch_batch=100)
+    cache.set("key", "value")
+    cache.get("key")
+    cache.close()
+
+    reopened = SQLiteCache(path)
+    assert len(reopened) == 1
+    assert reopened.get("key") == "value"
+    reopened.close()
+
+
+def test_lru_cache_async_interface_matches():
+    cache = LRUCache(max_size=2)
+
+    async def scenario():
+        await cache.aset("key", "value")
+        return await cache.aget("key"), await cache.aget("missing", "default")
+
+    assert asyncio.run(scenario()) == ("value", "default")
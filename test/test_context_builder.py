@@ -0,0 +1,130 @@
+# ===== CONTEXT BUILDER TESTS =====
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import agents.context_builder as context_builder
+from agents.context_builder import ContextBuilder, TokenCounter
+
+
+class WordCounter(TokenCounter):
+    """One token per whitespace-separated word, so budgets are easy to follow."""
+    def count(self, text):
+        return len(text.split())
+
+    def truncate(self, text, max_tokens):
+        return " ".join(text.split()[:max(0, max_tokens)])
+
+
+def render(position, record, text):
+    return f"{position}. {text}"
+
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(1, count + 1))
+
+
+@pytest.fixture(autouse=True)
+def small_truncation_floor(monkeypatch):
+    monkeypatch.setattr(context_builder, "MIN_TRUNCATED_TOKENS", 2)
+
+
+def builder(budget):
+    return ContextBuilder(budget_tokens=budget, counter=WordCounter())
+
+
+def test_records_that_fit_are_packed_in_order():
+    records = [{"description": "a b"}, {"description": "c d"}]
+    context, packed, truncated = builder(100).build(records, render, [])
+    assert context == "1. a b\n2. c d"
+    assert packed == records
+    assert truncated is False
+
+
+def test_fixed_prompt_parts_count_against_the_budget():
+    records = [{"description": "a b"}, {"description": "c d"}]
+    # 3 + 3 tokens of records, but the prompt already takes 4 of the 8
+    context, packed, _ = builder(8).build(records, render, ["system prompt", "user template"])
+    assert packed == records[:1]
+    assert context == "1. a b"
+
+
+def test_max_records_and_empty_records():
+    records = [{"description": ""}, {"suggestion": "s1"}, {"description": "d2"}, {"description": "d3"}]
+    context, packed, _ = builder(100).build(records, render, [], max_records=2)
+    assert context == "1. s1\n2. d2"
+    assert packed == records[1:3]
+
+
+def test_first_record_that_does_not_fit_is_truncated_and_packing_stops():
+    records = [{"description": words("w", 3)}, {"description": words("x", 10)}, {"description": "y"}]
+    context, packed, truncated = builder(10).build(records, render, ["a b"])
+    assert context == "1. w1 w2 w3\n2. x1 x2" + context_builder.ELLIPSIS
+    assert packed == records[:2]
+    assert truncated is True
+
+
+def test_record_is_dropped_when_too_little_of_it_would_survive():
+    records = [{"description": words("w", 4)}, {"description": words("x", 10)}]
+    context, packed, truncated = builder(8).build(records, render, [])
+    assert context == "1. w1 w2 w3 w4"
+    assert packed == records[:1]
+    assert truncated is False
+
+
+def test_a_lone_oversized_record_is_always_truncated():
+    records = [{"description": words("x", 10)}]
+    context, packed, truncated = builder(3).build(records, render, [])
+    assert context == "1. x1" + context_builder.ELLIPSIS
+    assert packed == records
+    assert truncated is True
+
+
+def test_count_messages_counts_message_content():
+    messages = [SimpleNamespace(content="one two"), SimpleNamespace(content="three"), "four five six"]
+    assert builder(100).count_messages(messages) == 6
+
+
+def test_token_counter_estimates_from_length_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(context_builder, "tiktoken", None)
+    counter = TokenCounter()
+    assert counter.count("x" * 9) == 3
+    assert counter.truncate("x" * 20, 2) == "x" * 8
+    assert counter.truncate("anything", 0) == ""
+    assert counter.encoding is None
+
+
+def test_token_counter_loads_the_encoding_lazily_off_the_caller(monkeypatch):
+    loads = []
+
+    class FakeEncoding:
+        def encode(self, text):
+            return text.split()
+
+        def decode(self, tokens):
+            return " ".join(tokens)
+
+    def get_encoding(name):
+        loads.append(name)
+        return FakeEncoding()
+
+    monkeypatch.setattr(context_builder, "tiktoken", SimpleNamespace(get_encoding=get_encoding))
+    counter = TokenCounter("test_encoding")
+    assert loads == []
+
+    # Until the background load finishes, counts fall back to the estimate
+    first = counter.count("alpha beta gamma")
+    assert first in (3, 4)
+    for thread in context_builder.threading.enumerate():
+        if thread.name == "tokenizer-load":
+            thread.join(timeout=1)
+
+    assert loads == ["test_encoding"]
+    assert counter.count("alpha beta gamma") == 3
+    assert counter.truncate("alpha beta gamma", 2) == "alpha beta"
+    counter.count("again")
+    assert loads == ["test_encoding"]
@@ -0,0 +1,117 @@
+# ===== DEADLINE TESTS =====
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.deadline import Deadline, DeadlineExceeded
+
+
+@pytest.mark.parametrize("timeout_ms", [None, 0, -5])
+def test_no_deadline(timeout_ms):
+    deadline = Deadline(timeout_ms)
+    assert deadline.timeout_ms is None
+    assert deadline.remaining() is None
+    assert deadline.expired() is False
+    assert deadline.budget_ms(150) == 150
+    assert deadline.budget_ms(None) is None
+    deadline.check("embed")
+
+
+def test_remaining_time_counts_down_and_never_goes_negative():
+    deadline = Deadline(30)
+    assert 0 < deadline.remaining() <= 0.03
+    time.sleep(0.04)
+    assert deadline.remaining() == 0.0
+    assert deadline.expired() is True
+    assert deadline.elapsed_ms() >= 40
+
+
+def test_budget_is_the_smaller_of_the_cap_and_the_time_left():
+    deadline = Deadline(10_000)
+    assert deadline.budget_ms(150) == 150
+    assert 9_000 < deadline.budget_ms(None) <= 10_000
+    # A cap of 0 means no cap of its own
+    assert 9_000 < deadline.budget_ms(0) <= 10_000
+
+
+def test_budget_is_never_zero_once_expired():
+    deadline = Deadline(1)
+    time.sleep(0.01)
+    # 0 would read as "no limit" to the stages
+    assert deadline.budget_ms(150) == 1.0
+    assert deadline.budget_ms(None) == 1.0
+
+
+def test_check_raises_with_the_stage_once_expired():
+    deadline = Deadline(1)
+    time.sleep(0.01)
+    with pytest.raises(DeadlineExceeded) as info:
+        deadline.check("retrieve")
+    assert info.value.stage == "retrieve"
+    assert isinstance(info.value, asyncio.TimeoutError)
+
+
+def test_run_returns_results_within_the_deadline():
+    async def stage():
+        await asyncio.sleep(0.001)
+        return "embedding"
+
+    assert asyncio.run(Deadline(1000).run("embed", stage())) == "embedding"
+    assert asyncio.run(Deadline(None).run("embed", stage())) == "embedding"
+
+
+def test_run_cancels_the_stage_when_time_runs_out():
+    cancelled = []
+
+    async def slow_stage():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        deadline = Deadline(20)
+        with pytest.raises(DeadlineExceeded) as info:
+            await deadline.run("generate", slow_stage())
+        return info.value.stage
+
+    assert asyncio.run(scenario()) == "generate"
+    assert cancelled == [True]
+
+
+def test_run_after_expiry_fails_without_starting_the_stage():
+    started = []
+
+    async def stage():
+        started.append(True)
+
+    async def scenario():
+        deadline = Deadline(1)
+        await asyncio.sleep(0.01)
+        coroutine = stage()
+        with pytest.raises(DeadlineExceeded):
+            await deadline.run("embed", coroutine)
+        return coroutine
+
+    coroutine = asyncio.run(scenario())
+    assert started == []
+    # Closed, so no "coroutine was never awaited" warning
+    assert coroutine.cr_frame is None
+
+
+def test_a_stage_timeout_before_the_deadline_is_not_a_deadline_error():
+    async def stage():
+        raise asyncio.TimeoutError()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError) as info:
+            await Deadline(10_000).run("retrieve", stage())
+        return info.value
+
+    assert not isinstance(asyncio.run(scenario()), DeadlineExceeded)
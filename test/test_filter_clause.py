@@ -0,0 +1,83 @@
+# ===== RETRIEVAL FILTER CLAUSE TESTS =====
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+# db.connection reads this at import; no connection is opened
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/test")
+
+from agents.retriever import build_filter_clause
+
+
+def test_no_filters_adds_nothing():
+    assert build_filter_clause(None, 3) == ("", [])
+    assert build_filter_clause({}, 3) == ("", [])
+
+
+def test_unknown_filters_are_rejected():
+    with pytest.raises(ValueError, match="merchant"):
+        build_filter_clause({"merchant": "ACME"}, 3)
+
+
+def test_single_category_is_a_bind_parameter_without_a_partial_index():
+    sql, params = build_filter_clause({"category": "Food"}, 3)
+    assert sql == " AND category = ANY($3::text[])"
+    assert params == [["Food"]]
+
+
+def test_single_category_with_a_partial_index_is_inlined():
+    sql, params = build_filter_clause({"category": "Food"}, 3, inline_categories={"Food"})
+    assert sql == " AND category = 'Food'"
+    assert params == []
+
+
+def test_inlined_category_quotes_are_escaped():
+    sql, _ = build_filter_clause({"category": "Kid's"}, 3, inline_categories={"Kid's"})
+    assert sql == " AND category = 'Kid''s'"
+
+
+def test_untrusted_category_never_reaches_the_sql_text():
+    value = "Food' OR '1'='1"
+    sql, params = build_filter_clause({"category": value}, 3, inline_categories={"Food"})
+    assert value not in sql
+    assert params == [[value]]
+
+
+def test_several_categories_are_bound_even_with_partial_indexes():
+    sql, params = build_filter_clause({"category": ["Food", "Travel"]}, 3, inline_categories={"Food", "Travel"})
+    assert sql == " AND category = ANY($3::text[])"
+    assert params == [["Food", "Travel"]]
+
+
+def test_every_filter_is_numbered_from_start_index_with_an_alias():
+    after = datetime(2024, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+    before = datetime(2024, 2, 1)
+    sql, params = build_filter_clause(
+        {
+            "insight_type": "saving",
+            "min_amount": 10,
+            "max_amount": "99.95",
+            "created_after": after,
+            "created_before": before,
+        },
+        5,
+        alias="t",
+    )
+    assert sql == (
+        " AND t.insight_type = ANY($5::text[])"
+        " AND t.amount >= $6::numeric"
+        " AND t.amount <= $7::numeric"
+        " AND t.created_at >= $8::timestamp"
+        " AND t.created_at < $9::timestamp"
+    )
+    assert params == [["saving"], Decimal("10"), Decimal("99.95"), datetime(2024, 1, 1, 10), before]
+
+
+def test_none_values_are_skipped():
+    sql, params = build_filter_clause({"category": None, "min_amount": None, "max_amount": 5}, 2)
+    assert sql == " AND amount <= $2::numeric"
+    assert params == [Decimal("5")]
@@ -0,0 +1,31 @@
+# ===== INDEX NAMING TESTS =====
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+# db.connection reads this at import; no connection is opened
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/test")
+
+from db.indexes import MAX_IDENTIFIER_BYTES, partial_index_name
+
+
+def test_partial_index_names_fit_the_identifier_limit():
+    for category in ("Food", "x" * 200, "Ünïcödé category " * 10):
+        name = partial_index_name(category)
+        assert len(name.encode("utf-8")) <= MAX_IDENTIFIER_BYTES
+        assert name.startswith("transaction_insights_embedding_")
+        assert name.endswith("_idx")
+
+
+def test_categories_that_slug_alike_get_distinct_names():
+    assert partial_index_name("Food & Dining") != partial_index_name("Food - Dining")
+
+
+def test_categories_sharing_a_long_prefix_get_distinct_names():
+    prefix = "Household utilities and recurring bills "
+    assert partial_index_name(prefix + "electricity") != partial_index_name(prefix + "water")
+
+
+def test_partial_index_names_are_stable_and_readable():
+    assert partial_index_name("Food") == partial_index_name("Food")
+    assert "_food_" in partial_index_name("Food")
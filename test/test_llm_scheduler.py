@@ -0,0 +1,270 @@
+# ===== LLM SCHEDULER BEHAVIOR TESTS =====
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import agents.llm_scheduler as llm_scheduler
+from agents.llm_scheduler import LLMScheduler, TokenBucket, estimate_tokens
+
+
+class ProviderError(Exception):
+    """Shaped like the Groq SDK's status errors."""
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class FakeChatModel:
+    """Chat model double: fails with the queued errors, then answers."""
+    def __init__(self, errors=(), total_tokens=None, delay=0.0, chunks=("a", "b")):
+        self.errors = list(errors)
+        self.total_tokens = total_tokens
+        self.delay = delay
+        self.chunks = chunks
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.max_tokens = None
+
+    def _message(self, content, total=None):
+        usage = {"total_tokens": total} if total is not None else None
+        return SimpleNamespace(content=content, usage_metadata=usage)
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            return self._message("answer", self.total_tokens)
+        finally:
+            self.active -= 1
+
+    async def astream(self, messages):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        for i, chunk in enumerate(self.chunks):
+            last = i == len(self.chunks) - 1
+            yield self._message(chunk, self.total_tokens if last else None)
+
+
+class BrokenStreamModel(FakeChatModel):
+    """Streams one chunk, then loses the connection."""
+    async def astream(self, messages):
+        self.calls += 1
+        yield self._message("a")
+        raise ProviderError(503)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "LLM_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(llm_scheduler, "LLM_BACKOFF_MAX", 0.01)
+
+
+def unlimited(llm, **kwargs):
+    options = {"max_concurrency": 4, "requests_per_minute": 0, "tokens_per_minute": 0, "max_retries": 3}
+    options.update(kwargs)
+    return LLMScheduler(llm, **options)
+
+
+def test_token_bucket_disabled_never_waits():
+    async def scenario():
+        bucket = TokenBucket(0)
+        start = time.monotonic()
+        for _ in range(100):
+            await bucket.acquire(1000)
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) < 0.05
+
+
+def test_token_bucket_waits_for_refill():
+    async def scenario():
+        # 100 units per second
+        bucket = TokenBucket(6000)
+        await bucket.acquire(6000)
+        start = time.monotonic()
+        await bucket.acquire(5)
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.04
+
+
+def test_token_bucket_clamps_requests_larger_than_capacity():
+    async def scenario():
+        bucket = TokenBucket(60)
+        start = time.monotonic()
+        await bucket.acquire(10_000)
+        return time.monotonic() - start, bucket.level
+
+    elapsed, level = asyncio.run(scenario())
+    assert elapsed < 0.05
+    assert level == pytest.approx(0, abs=0.1)
+
+
+def test_token_bucket_adjust_charges_and_refunds_within_capacity():
+    bucket = TokenBucket(600)
+    bucket.adjust(800)
+    assert bucket.level < 0
+    bucket.adjust(-10_000)
+    assert bucket.level == bucket.capacity
+
+
+def test_token_bucket_block_holds_callers():
+    async def scenario():
+        bucket = TokenBucket(6000)
+        bucket.block(0.05)
+        start = time.monotonic()
+        await bucket.acquire(1)
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.04
+
+
+def test_estimate_tokens_counts_prompt_and_completion_limit():
+    messages = [SimpleNamespace(content="x" * 40), "y" * 8]
+    assert estimate_tokens(messages) == 12
+    assert estimate_tokens(messages, max_tokens=100) == 112
+
+
+def test_concurrency_is_capped():
+    async def scenario():
+        llm = FakeChatModel(delay=0.01)
+        scheduler = unlimited(llm, max_concurrency=2)
+        await asyncio.gather(*(scheduler.ainvoke(["hi"]) for _ in range(6)))
+        return llm, scheduler.stats()
+
+    llm, stats = asyncio.run(scenario())
+    assert llm.max_active == 2
+    assert stats["calls"] == 6
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+
+
+def test_queued_calls_are_admitted_by_priority():
+    async def scenario():
+        order = []
+
+        class RecordingModel(FakeChatModel):
+            async def ainvoke(self, messages):
+                order.append(messages[0])
+                await asyncio.sleep(0.01)
+                return self._message("ok")
+
+        scheduler = unlimited(RecordingModel(), max_concurrency=1)
+        first = asyncio.ensure_future(scheduler.ainvoke(["running"], priority=5))
+        await asyncio.sleep(0)
+        low = asyncio.ensure_future(scheduler.ainvoke(["query"], priority=1))
+        await asyncio.sleep(0)
+        high = asyncio.ensure_future(scheduler.ainvoke(["suggestions"], priority=0))
+        await asyncio.gather(first, low, high)
+        return order
+
+    assert asyncio.run(scenario()) == ["running", "suggestions", "query"]
+
+
+def test_rate_limits_are_retried_and_block_the_request_bucket():
+    async def scenario():
+        llm = FakeChatModel(errors=[ProviderError(429, retry_after=0.02), ProviderError(503)])
+        scheduler = LLMScheduler(llm, requests_per_minute=6000, tokens_per_minute=0, max_retries=3)
+        response = await scheduler.ainvoke(["hi"])
+        return llm, response, scheduler.stats()
+
+    llm, response, stats = asyncio.run(scenario())
+    assert response.content == "answer"
+    assert llm.calls == 3
+    assert stats["retries"] == 2
+    assert stats["rate_limited"] == 1
+    assert stats["failures"] == 0
+
+
+def test_non_retryable_errors_fail_immediately():
+    async def scenario():
+        llm = FakeChatModel(errors=[ProviderError(400)])
+        scheduler = unlimited(llm)
+        with pytest.raises(ProviderError):
+            await scheduler.ainvoke(["hi"])
+        return llm, scheduler.stats()
+
+    llm, stats = asyncio.run(scenario())
+    assert llm.calls == 1
+    assert stats["failures"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_retries_stop_after_max_retries():
+    async def scenario():
+        llm = FakeChatModel(errors=[ProviderError(500)] * 5)
+        scheduler = unlimited(llm, max_retries=2)
+        with pytest.raises(ProviderError):
+            await scheduler.ainvoke(["hi"])
+        return llm, scheduler.stats()
+
+    llm, stats = asyncio.run(scenario())
+    assert llm.calls == 3
+    assert stats["retries"] == 2
+    assert stats["failures"] == 1
+
+
+def test_ainvoke_settles_reported_usage():
+    async def scenario():
+        scheduler = LLMScheduler(FakeChatModel(total_tokens=30), requests_per_minute=0, tokens_per_minute=60_000)
+        await scheduler.ainvoke(["x" * 400])
+        return scheduler.tokens
+
+    tokens = asyncio.run(scenario())
+    # The 100-token estimate is replaced by the 30 tokens actually used
+    assert tokens.capacity - tokens.level == pytest.approx(30, abs=1)
+
+
+def test_astream_yields_chunks_and_settles_usage():
+    async def scenario():
+        scheduler = LLMScheduler(FakeChatModel(total_tokens=30), requests_per_minute=0, tokens_per_minute=60_000)
+        chunks = [chunk.content async for chunk in scheduler.astream(["x" * 400])]
+        return chunks, scheduler.tokens
+
+    chunks, tokens = asyncio.run(scenario())
+    assert chunks == ["a", "b"]
+    assert tokens.capacity - tokens.level == pytest.approx(30, abs=1)
+
+
+def test_astream_retries_before_the_first_chunk():
+    async def scenario():
+        llm = FakeChatModel(errors=[ProviderError(503)])
+        scheduler = unlimited(llm)
+        chunks = [chunk.content async for chunk in scheduler.astream(["hi"])]
+        return llm, chunks, scheduler.stats()
+
+    llm, chunks, stats = asyncio.run(scenario())
+    assert chunks == ["a", "b"]
+    assert llm.calls == 2
+    assert stats["retries"] == 1
+
+
+def test_astream_failures_after_the_first_chunk_propagate():
+    async def scenario():
+        llm = BrokenStreamModel()
+        scheduler = unlimited(llm)
+        received = []
+        with pytest.raises(ProviderError):
+            async for chunk in scheduler.astream(["hi"]):
+                received.append(chunk.content)
+        return llm, received, scheduler.stats()
+
+    llm, received, stats = asyncio.run(scenario())
+    assert received == ["a"]
+    assert llm.calls == 1
+    assert stats["failures"] == 1
+    assert stats["in_flight"] == 0
@@ -0,0 +1,95 @@
+# ===== MAXIMAL MARGINAL RELEVANCE TESTS =====
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+# db.connection reads this at import; no connection is opened
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/test")
+
+from agents.retriever import Retriever, maximal_marginal_relevance
+
+QUERY = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+CANDIDATES = np.array([
+    [0.95, 0.30, 0.0],   # 0: most relevant
+    [0.94, 0.33, 0.0],   # 1: near-duplicate of 0
+    [0.80, 0.0, 0.60],   # 2: relevant and different
+    [0.0, 1.0, 0.0],     # 3: unrelated
+], dtype=np.float32)
+
+
+def test_no_candidates_or_no_slots_selects_nothing():
+    assert maximal_marginal_relevance(QUERY, np.zeros((0, 3)), top_k=3) == []
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=0) == []
+
+
+def test_most_relevant_candidate_comes_first():
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=1) == [0]
+
+
+def test_lambda_one_is_plain_relevance_order():
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=4, lambda_mult=1.0) == [0, 1, 2, 3]
+
+
+def test_near_duplicates_give_way_to_diverse_candidates():
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_top_k_larger_than_pool_returns_each_candidate_once():
+    selected = maximal_marginal_relevance(QUERY, CANDIDATES, top_k=10, lambda_mult=0.5)
+    assert sorted(selected) == [0, 1, 2, 3]
+
+
+def test_unnormalized_and_zero_vectors_are_handled():
+    scaled = CANDIDATES * np.array([[10.0], [0.1], [3.0], [7.0]], dtype=np.float32)
+    assert maximal_marginal_relevance(QUERY * 5, scaled, top_k=2, lambda_mult=0.5) == [0, 2]
+
+    with_zero = np.vstack([CANDIDATES, np.zeros((1, 3), dtype=np.float32)])
+    selected = maximal_marginal_relevance(QUERY, with_zero, top_k=5)
+    assert sorted(selected) == [0, 1, 2, 3, 4]
+
+
+def test_relevance_override_replaces_the_cosine_term():
+    # Candidate 3 is unrelated by cosine but ranked first by the caller
+    relevance = np.array([0.5, 0.4, 0.3, 1.0], dtype=np.float32)
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=1, relevance=relevance) == [3]
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=4, lambda_mult=1.0, relevance=relevance) == [3, 0, 1, 2]
+
+
+def hybrid_row(id, description, embedding, similarity, rrf):
+    return {
+        "id": id,
+        "description": description,
+        "embedding": np.array(embedding, dtype=np.float32),
+        "similarity_score": similarity,
+        "rrf_score": rrf,
+    }
+
+
+def test_hybrid_mmr_keeps_lexical_hits_in_fusion_order():
+    # "Netflix" only matched the full-text side, so its cosine is low but
+    # fusion ranked it first
+    rows = [
+        hybrid_row(1, "Netflix subscription renewed", [0.0, 1.0, 0.0], 0.05, 0.033),
+        hybrid_row(2, "Streaming services spend", [0.95, 0.30, 0.0], 0.95, 0.016),
+        hybrid_row(3, "Streaming services spend again", [0.94, 0.33, 0.0], 0.94, 0.015),
+        hybrid_row(4, "Entertainment budget", [0.80, 0.0, 0.60], 0.80, 0.014),
+    ]
+    results = Retriever()._diversify(QUERY, rows, top_k=3, mmr_lambda=0.5)
+
+    # The lexical hit stays first and the near-duplicate streaming row is dropped
+    assert [record["id"] for record in results] == [1, 4, 2]
+    assert [record["rank"] for record in results] == [1, 2, 3]
+    scores = [record["fusion_score"] for record in results]
+    assert results[0]["fusion_score"] == max(scores)
+    assert "embedding" not in results[0]
+
+
+def test_vector_mmr_still_scores_on_cosine():
+    rows = [
+        {"id": i, "description": f"row {i}", "embedding": embedding, "similarity_score": 0.5}
+        for i, embedding in enumerate(CANDIDATES)
+    ]
+    results = Retriever()._diversify(QUERY, rows, top_k=2, mmr_lambda=0.5)
+    assert [record["id"] for record in results] == [0, 2]
@@ -0,0 +1,99 @@
+# ===== SEMANTIC CACHE BEHAVIOR TESTS =====
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.semantic_cache import SemanticCache
+
+
+def unit(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_close_paraphrase_hits_and_reports_the_stored_query():
+    cache = SemanticCache(dim=3, threshold=0.9)
+    cache.set(unit(1, 0, 0), "how much did I spend on food?", {"answer": "120"})
+
+    hit = cache.get(unit(0.98, 0.1, 0))
+    assert hit is not None
+    value, query, similarity = hit
+    assert value == {"answer": "120"}
+    assert query == "how much did I spend on food?"
+    assert 0.9 <= similarity <= 1.0
+
+
+def test_lookups_are_scale_invariant():
+    cache = SemanticCache(dim=2, threshold=0.99)
+    cache.set(unit(3, 4), "q", "a")
+    assert cache.get(unit(0.6, 0.8))[2] == pytest.approx(1.0, abs=1e-6)
+
+
+def test_below_threshold_misses():
+    cache = SemanticCache(dim=2, threshold=0.95)
+    cache.set(unit(1, 0), "q", "a")
+    assert cache.get(unit(1, 1)) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_empty_cache_misses():
+    cache = SemanticCache(dim=2)
+    assert cache.get(unit(1, 0)) is None
+    assert cache.stats()["hits"] == 0
+
+
+def test_best_match_wins():
+    cache = SemanticCache(dim=2, threshold=0.5)
+    cache.set(unit(1, 0.5), "near", "near answer")
+    cache.set(unit(1, 0.05), "nearest", "nearest answer")
+    assert cache.get(unit(1, 0))[:2] == ("nearest answer", "nearest")
+
+
+def test_namespaces_are_isolated():
+    cache = SemanticCache(dim=2, threshold=0.9)
+    cache.set(unit(1, 0), "q", "vector answer", namespace="vector")
+    assert cache.get(unit(1, 0), namespace="hybrid") is None
+    cache.set(unit(1, 0), "q", "hybrid answer", namespace="hybrid")
+    assert cache.get(unit(1, 0), namespace="vector")[0] == "vector answer"
+    assert cache.get(unit(1, 0), namespace="hybrid")[0] == "hybrid answer"
+
+
+def test_expired_entries_miss():
+    cache = SemanticCache(dim=2, ttl=0.02)
+    cache.set(unit(1, 0), "q", "a")
+    assert cache.get(unit(1, 0)) is not None
+    time.sleep(0.03)
+    assert cache.get(unit(1, 0)) is None
+
+
+def test_least_recently_used_entry_is_overwritten():
+    cache = SemanticCache(dim=2, max_size=2, threshold=0.99)
+    cache.set(unit(1, 0), "first", "a")
+    cache.set(unit(0, 1), "second", "b")
+    # Touch the first entry so the second is the least recently used
+    assert cache.get(unit(1, 0)) is not None
+    cache.set(unit(1, 1), "third", "c")
+
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(unit(1, 0))[1] == "first"
+    assert cache.get(unit(0, 1)) is None
+    assert cache.get(unit(1, 1))[1] == "third"
+
+
+def test_clear_drops_entries_but_keeps_counters():
+    cache = SemanticCache(dim=2)
+    cache.set(unit(1, 0), "q", "a", namespace="ns")
+    cache.get(unit(1, 0), namespace="ns")
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.get(unit(1, 0), namespace="ns") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
@@ -0,0 +1,202 @@
+# ===== SINGLEFLIGHT BEHAVIOR TESTS =====
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"answer": 42}
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(3)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True]
+    assert all(result is results[0][0] for result, _ in results)
+    assert flight.stats()["leaders"] == 1
+    assert flight.stats()["coalesced"] == 2
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_different_keys_and_later_calls_run_separately():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0)
+            return len(calls)
+
+        await asyncio.gather(flight.do("a", work), flight.do("b", work))
+        # The first run has finished, so this starts a new one
+        result, shared = await flight.do("a", work)
+        return calls, result, shared
+
+    calls, result, shared = asyncio.run(scenario())
+    assert len(calls) == 3
+    assert result == 3
+    assert shared is False
+
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelling_one_caller_keeps_the_run_for_the_others():
+    async def scenario():
+        flight = SingleFlight()
+        started = []
+
+        async def work():
+            started.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        return first, result, started
+
+    first, result, started = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result == ("done", True)
+    assert len(started) == 1
+
+
+def test_cancelling_the_last_caller_cancels_the_run():
+    async def scenario():
+        flight = SingleFlight()
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.05)
+            finished.append(1)
+
+        caller = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.08)
+        return flight, finished
+
+    flight, finished = asyncio.run(scenario())
+    assert finished == []
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_stream_replays_items_to_late_subscribers():
+    async def scenario():
+        flight = SingleFlight()
+        upstreams = []
+
+        async def produce():
+            upstreams.append(1)
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield i
+
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            return [item async for item in flight.stream("key", produce)]
+
+        results = await asyncio.gather(consume(0), consume(0.015))
+        return flight, upstreams, results
+
+    flight, upstreams, results = asyncio.run(scenario())
+    assert len(upstreams) == 1
+    assert results[0] == [(0, False), (1, False), (2, False)]
+    assert results[1] == [(0, True), (1, True), (2, True)]
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_stream_errors_reach_every_subscriber():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def produce():
+            yield "first"
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        async def consume():
+            items = []
+            try:
+                async for item, _ in flight.stream("key", produce):
+                    items.append(item)
+            except RuntimeError as e:
+                return items, str(e)
+            return items, None
+
+        return await asyncio.gather(consume(), consume())
+
+    results = asyncio.run(scenario())
+    assert results == [(["first"], "upstream failed")] * 2
+
+
+def test_stream_upstream_is_cancelled_when_every_subscriber_leaves():
+    async def scenario():
+        flight = SingleFlight()
+        produced = []
+
+        async def produce():
+            for i in range(100):
+                produced.append(i)
+                yield i
+                await asyncio.sleep(0.01)
+
+        subscriber = flight.stream("key", produce)
+        first, _ = await subscriber.__anext__()
+        await subscriber.aclose()
+        await asyncio.sleep(0.05)
+        return flight, first, produced
+
+    flight, first, produced = asyncio.run(scenario())
+    assert first == 0
+    assert len(produced) < 5
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("subscribers", [1, 4])
+def test_stream_counts_leaders_and_coalesced(subscribers):
+    async def scenario():
+        flight = SingleFlight()
+
+        async def produce():
+            await asyncio.sleep(0.01)
+            yield "only"
+
+        async def consume():
+            return [item async for item in flight.stream("key", produce)]
+
+        await asyncio.gather(*(consume() for _ in range(subscribers)))
+        return flight.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["leaders"] == 1
+    assert stats["coalesced"] == subscribers - 1
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, Optional
+
+class LRUCache:
+    """
+    Size-bounded in-process cache with LRU eviction and an optional TTL.
+    Tracks hit/miss/eviction counters for metrics.
+    """
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default on a miss or expired entry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry when full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        """get() for async callers (in-process, so it never blocks)."""
+        return self.get(key, default)
+
+    async def aset(self, key: Hashable, value: Any):
+        """set() for async callers (in-process, so it never blocks)."""
+        self.set(key, value)
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for metrics endpoints."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+class SQLiteCache:
+    """
+    On-disk cache with the same interface as LRUCache, for values that should
+    survive restarts and be shared between worker processes. Keys and values
+    must be JSON-serializable; entries past max_size are evicted oldest-used
+    first.
+
+    Async code should use aget/aset, which run the SQLite I/O on a dedicated
+    thread so disk waits never stall the event loop; get/set are the same
+    calls made synchronously. The hot path is kept to one indexed read per
+    get: recency updates are buffered and written in batches of touch_batch,
+    and the size is tracked in memory and only recounted (then trimmed to
+    evict_to of max_size, so eviction is amortized) once it may exceed
+    max_size. With several processes sharing the file the size is approximate.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 10000,
+        ttl: Optional[float] = None,
+        touch_batch: int = 64,
+        evict_to: float = 0.9
+    ):
+        self.path = path
+        self.max_size = max(1, max_size)
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.touch_batch = max(1, touch_batch)
+        self.evict_to = min(1.0, max(0.0, evict_to))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Under WAL this only fsyncs at checkpoints; a crash can lose the
+        # latest entries, which is fine for a cache
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # One thread, so the connection is never used concurrently
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-cache")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                used_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_used_at ON cache (used_at)")
+        # Pending used_at updates, keyed by serialized key
+        self._touched: Dict[str, float] = {}
+        self._size = self._count()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default on a miss or expired entry."""
+        key = json.dumps(key)
+        row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        # Wall-clock time, since entries outlive the process
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] <= now):
+            # Expired rows are left for eviction to remove
+            self.misses += 1
+            return default
+        self._touched[key] = now
+        if len(self._touched) >= self.touch_batch:
+            self._flush_touches()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entries when full."""
+        key = json.dumps(key)
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires_at, now)
+        )
+        self._touched.pop(key, None)
+        # Counted as new even when it replaced an entry; _evict recounts
+        self._size += 1
+        if self._size > self.max_size:
+            self._evict(now)
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        """get() on the cache's I/O thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, key, default)
+
+    async def aset(self, key: Hashable, value: Any):
+        """set() (and any eviction it triggers) on the cache's I/O thread."""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.set, key, value)
+
+    def _flush_touches(self):
+        """Write buffered used_at updates in one transaction."""
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                "UPDATE cache SET used_at = ? WHERE key = ?",
+                [(used_at, key) for key, used_at in touched.items()]
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used down to evict_to of max_size."""
+        self._flush_touches()
+        self._size = self._count()
+        if self._size <= self.max_size:
+            return
+        expired = self._conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        excess = self._size - expired - int(self.max_size * self.evict_to)
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used_at LIMIT ?)",
+                (excess,)
+            )
+        self.evictions += expired + max(0, excess)
+        self._size = self._count()
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        self._touched.clear()
+        self._conn.execute("DELETE FROM cache")
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for metrics endpoints."""
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "size": self._size,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        # Let queued reads and writes finish before the final flush
+        self._executor.shutdown(wait=True)
+        self._flush_touches()
+        self._conn.close()
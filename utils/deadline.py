@@ -0,0 +1,64 @@
+import asyncio
+import time
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """A pipeline stage ran out of time (its own timeout or the request's deadline)."""
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+
+class Deadline:
+    """
+    Time budget for one request, shared by every stage of its pipeline. Each
+    stage runs under whatever is left; timeout_ms of None or <= 0 means no
+    deadline.
+    """
+    def __init__(self, timeout_ms: Optional[float]):
+        self.timeout_ms = timeout_ms if timeout_ms and timeout_ms > 0 else None
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.timeout_ms / 1000 if self.timeout_ms else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None without a deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+    def budget_ms(self, cap_ms: Optional[float] = None) -> Optional[float]:
+        """
+        Milliseconds a stage may spend: the time left, bounded by the stage's
+        own cap_ms when it has one (None or <= 0 = no cap).
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return cap_ms
+        # Stages treat 0 as "no limit", so never hand one out
+        remaining_ms = max(1.0, remaining * 1000)
+        return min(cap_ms, remaining_ms) if cap_ms and cap_ms > 0 else remaining_ms
+
+    def check(self, stage: str):
+        """Raise DeadlineExceeded before starting a stage if no time is left."""
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """Await a stage under the remaining budget, cancelling it when time runs out."""
+        if self.expired():
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(stage)
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.remaining())
+        except asyncio.TimeoutError:
+            if self.expired():
+                raise DeadlineExceeded(stage) from None
+            raise
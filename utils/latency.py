@@ -0,0 +1,25 @@
+from collections import deque
+from typing import Optional
+
+class LatencyTracker:
+    """
+    Sliding window of recent latencies (seconds) for percentile estimates,
+    e.g. to pick a hedging delay from observed tail latency.
+    """
+    def __init__(self, window: int = 500):
+        self._samples: deque = deque(maxlen=max(1, window))
+
+    def record(self, seconds: float):
+        """Add one observed latency."""
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile (0-100) of the window, or None when it is empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return ordered[index]
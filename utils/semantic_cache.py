@@ -0,0 +1,96 @@
+import time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+
+class SemanticCache:
+    """
+    Cache keyed on query embeddings rather than exact text. Entries live in a
+    preallocated float32 matrix of normalized rows, so a lookup is one
+    matrix-vector product; the best match is returned when its cosine
+    similarity reaches the threshold. Entries are only matched within the same
+    namespace (e.g. a hash of request options). Least recently used entries are
+    overwritten once max_size is reached.
+    """
+    def __init__(self, dim: int, max_size: int = 1000, threshold: float = 0.95, ttl: Optional[float] = None):
+        self.dim = dim
+        self.max_size = max(1, max_size)
+        self.threshold = threshold
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._matrix = np.zeros((self.max_size, dim), dtype=np.float32)
+        self._last_used = np.zeros(self.max_size, dtype=np.int64)
+        self._expires_at = np.full(self.max_size, np.inf)
+        self._queries: List[Optional[str]] = [None] * self.max_size
+        self._values: List[Any] = [None] * self.max_size
+        # Namespaces are mapped to small integers so matching stays vectorized
+        self._namespace_ids = np.full(self.max_size, -1, dtype=np.int64)
+        self._namespace_codes: Dict[Hashable, int] = {}
+        self._size = 0
+        self._tick = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _normalize(self, embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get(self, embedding: np.ndarray, namespace: Hashable = None) -> Optional[Tuple[Any, str, float]]:
+        """Return (value, stored query, similarity) for the closest match, or None."""
+        code = self._namespace_codes.get(namespace)
+        if self._size == 0 or code is None:
+            self.misses += 1
+            return None
+        scores = self._matrix[:self._size] @ self._normalize(embedding)
+        scores[self._namespace_ids[:self._size] != code] = -np.inf
+        scores[self._expires_at[:self._size] <= time.monotonic()] = -np.inf
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+        if similarity < self.threshold:
+            self.misses += 1
+            return None
+        self._tick += 1
+        self._last_used[best] = self._tick
+        self.hits += 1
+        return self._values[best], self._queries[best], similarity
+
+    def set(self, embedding: np.ndarray, query: str, value: Any, namespace: Hashable = None):
+        """Store a value for this query embedding, evicting the LRU entry when full."""
+        if self._size < self.max_size:
+            slot = self._size
+            self._size += 1
+        else:
+            slot = int(np.argmin(self._last_used))
+            self.evictions += 1
+        self._tick += 1
+        self._matrix[slot] = self._normalize(embedding)
+        self._last_used[slot] = self._tick
+        self._expires_at[slot] = time.monotonic() + self.ttl if self.ttl else np.inf
+        self._queries[slot] = query
+        self._values[slot] = value
+        self._namespace_ids[slot] = self._namespace_codes.setdefault(namespace, len(self._namespace_codes))
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        self._size = 0
+        self._queries = [None] * self.max_size
+        self._values = [None] * self.max_size
+        self._namespace_ids[:] = -1
+        self._namespace_codes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for metrics endpoints."""
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
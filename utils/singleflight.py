@@ -0,0 +1,125 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+class _SharedStream:
+    """One upstream async iterator being fanned out to its subscribers."""
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.Event()
+
+    def publish(self):
+        """Wake every subscriber waiting for the next item (or the end)."""
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    work, later callers await the same task until it finishes. The work runs
+    as its own task, so it is only cancelled once every caller waiting on it
+    has been cancelled. stream() does the same for async iterators, replaying
+    every item produced so far to callers that join late.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, Tuple[asyncio.Task, list]] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared), where shared is True for callers that joined a call in flight."""
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(fn())
+            call = (task, [0])
+            self._calls[key] = call
+            task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+            self.leaders += 1
+            shared = False
+        else:
+            self.coalesced += 1
+            shared = True
+
+        task, callers = call
+        callers[0] += 1
+        self.max_waiters = max(self.max_waiters, callers[0] - 1)
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if not task.done() and callers[0] == 1:
+                # Nobody else is waiting for this result
+                task.cancel()
+            raise
+        finally:
+            callers[0] -= 1
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Tuple[Any, bool]]:
+        """
+        Yield (item, shared) for every item of fn(), consuming one upstream
+        iterator per key. Items are the same objects for every subscriber, so
+        shared subscribers should copy them before mutating. The upstream is
+        cancelled once every subscriber has gone away.
+        """
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = _SharedStream()
+            self._streams[key] = stream
+            stream.task = asyncio.ensure_future(self._pump(key, stream, fn()))
+            self.leaders += 1
+            shared = False
+        else:
+            self.coalesced += 1
+            shared = True
+
+        stream.subscribers += 1
+        self.max_waiters = max(self.max_waiters, stream.subscribers - 1)
+        position = 0
+        try:
+            while True:
+                while position < len(stream.items):
+                    yield stream.items[position], shared
+                    position += 1
+                if stream.done:
+                    if stream.error is not None:
+                        raise stream.error
+                    return
+                await stream.changed.wait()
+        finally:
+            stream.subscribers -= 1
+            if stream.subscribers == 0 and not stream.done:
+                # Nobody is reading this stream any more
+                stream.task.cancel()
+
+    async def _pump(self, key: Hashable, stream: _SharedStream, upstream: AsyncIterator[Any]):
+        """Read the upstream iterator into the shared buffer."""
+        try:
+            async for item in upstream:
+                stream.items.append(item)
+                stream.publish()
+        except Exception as e:
+            stream.error = e
+        finally:
+            stream.done = True
+            stream.publish()
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+
+    def _forget(self, key: Hashable, call: tuple):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self):
+        """Coalescing counters for metrics endpoints."""
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "waiting": sum(callers[0] for _, callers in self._calls.values())
+                + sum(stream.subscribers for stream in self._streams.values()),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "max_waiters": self.max_waiters
+        }